@@ -2,10 +2,16 @@
 Configuration for Cloud Run Full Pipeline Service
 """
 import os
-from dotenv import load_dotenv
+import threading
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Optional, Tuple
 
-# Load environment variables
-load_dotenv()
+# Load environment variables from .env (local dev only; Cloud Run sets K_SERVICE
+# and injects env vars itself, so skip the dotenv import and file walk there)
+if not os.environ.get('K_SERVICE'):
+    from dotenv import load_dotenv
+    load_dotenv()
 
 class Config:
     """Application configuration"""
@@ -38,34 +44,62 @@ class Config:
     # Timeouts (seconds)
     JOB_TIMEOUT = int(os.getenv('JOB_TIMEOUT', 3600))  # 1 hour
     
+    # Concurrency (pipeline jobs running at once per instance)
+    MAX_CONCURRENT_JOBS = int(os.getenv('MAX_CONCURRENT_JOBS', 2))
+    
+    # Set once ensure_dirs has run in this process
+    _dirs_ready = False
+    _dirs_lock = threading.Lock()
+    
     @classmethod
     def ensure_dirs(cls):
-        """Ensure output directories exist"""
-        for d in [cls.OUTPUT_DIR, cls.TEMP_DIR, cls.REFERENCE_DIR]:
-            os.makedirs(d, exist_ok=True)
+        """Ensure output directories exist (makedirs tolerates existing dirs, no stat needed)"""
+        if cls._dirs_ready:
+            return
+        with cls._dirs_lock:
+            if cls._dirs_ready:
+                return
+            for d in [cls.OUTPUT_DIR, cls.TEMP_DIR, cls.REFERENCE_DIR]:
+                os.makedirs(d, exist_ok=True)
+            cls._dirs_ready = True
 
 
+@dataclass(frozen=True)
 class PipelineConfig:
-    """Configuration for pipeline execution"""
+    """Configuration for pipeline execution (immutable once built)"""
+    
+    count: int = Config.DEFAULT_COUNT
+    style_id: str = Config.DEFAULT_STYLE_ID
+    reference_videos: Tuple[str, ...] = ()
+    webhook_url: Optional[str] = None
     
-    def __init__(self, data: dict):
-        self.count = min(data.get('count', Config.DEFAULT_COUNT), Config.MAX_COUNT)
-        self.style_id = data.get('style_id', Config.DEFAULT_STYLE_ID)
-        self.reference_videos = data.get('reference_videos', [])
-        self.webhook_url = data.get('webhook_url')
-        self.options = data.get('options', {})
-        
-        # Option defaults
-        self.skip_existing = self.options.get('skip_existing', True)
-        self.generate_variants = self.options.get('generate_variants', True)
-        self.create_soundtracks = self.options.get('create_soundtracks', True)
-        self.apply_watermark = self.options.get('apply_watermark', True)
+    # Options
+    skip_existing: bool = True
+    generate_variants: bool = True
+    create_soundtracks: bool = True
+    apply_watermark: bool = True
     
-    def to_dict(self):
+    @classmethod
+    def from_request(cls, data: dict) -> 'PipelineConfig':
+        """Build config from a /pipeline/run request body, applying defaults and limits"""
+        options = data.get('options') or {}
+        return cls(
+            count=min(data.get('count', Config.DEFAULT_COUNT), Config.MAX_COUNT),
+            style_id=data.get('style_id', Config.DEFAULT_STYLE_ID),
+            reference_videos=tuple(data.get('reference_videos') or ()),
+            webhook_url=data.get('webhook_url'),
+            skip_existing=options.get('skip_existing', True),
+            generate_variants=options.get('generate_variants', True),
+            create_soundtracks=options.get('create_soundtracks', True),
+            apply_watermark=options.get('apply_watermark', True)
+        )
+    
+    @cached_property
+    def _as_dict(self) -> dict:
         return {
             'count': self.count,
             'style_id': self.style_id,
-            'reference_videos': self.reference_videos,
+            'reference_videos': list(self.reference_videos),
             'webhook_url': self.webhook_url,
             'options': {
                 'skip_existing': self.skip_existing,
@@ -74,3 +108,7 @@ class PipelineConfig:
                 'apply_watermark': self.apply_watermark
             }
         }
+    
+    def to_dict(self) -> dict:
+        """Serialized config (built once, treat as read-only)"""
+        return self._as_dict
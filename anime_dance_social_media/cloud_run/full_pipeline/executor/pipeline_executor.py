@@ -3,11 +3,14 @@ Pipeline Executor - Wraps batch workflow for Cloud Run execution
 """
 import os
 import sys
+import json
 import time
+import logging
 import random
 import shutil
+import threading
 from pathlib import Path
-from typing import Dict, Any, Optional, List, Callable
+from typing import Dict, Any, Optional, List, Callable, NamedTuple
 
 # Add project root to path
 ROOT = Path(__file__).parent.parent.parent.parent  # up to anime_dance_social_media
@@ -16,11 +19,43 @@ sys.path.insert(0, str(ROOT))
 from config import Config, PipelineConfig
 from services.job_tracker import JobTracker
 
-# Import workflows
-from workflows.character_gen import generate_characters, generate_new_targets_list
-from workflows.main_pipeline import run_end_to_end_pipeline
-from services.gemini_service import GeminiService
-from utils.db_utils import load_db, get_entry
+# Workflow/Gemini modules are imported inside the methods that use them, so
+# importing this module (and serving /health) doesn't pay their import cost
+from utils.db_utils import iter_db, get_entry
+
+
+class StructuredFormatter(logging.Formatter):
+    """One JSON object per record (Cloud Logging parses severity/message)"""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'severity': record.levelname,
+            'message': record.getMessage(),
+            'logger': record.name
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+logger = logging.getLogger('pipeline')
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(StructuredFormatter())
+    logger.addHandler(_handler)
+    logger.setLevel(os.getenv('PIPELINE_LOG_LEVEL', 'INFO').upper())
+    logger.propagate = False
+
+
+class Ref(NamedTuple):
+    """Reference video (full path + file name)"""
+    path: str
+    name: str
+
+
+def _assets_by_title(entry: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Index an entry's assets by title (first match wins); the entry is left untouched"""
+    return {a.get('title'): a for a in reversed(entry.get('assets') or [])}
 
 
 class PipelineExecutor:
@@ -35,41 +70,51 @@ class PipelineExecutor:
         
         # Setup directories
         Config.ensure_dirs()
-        self.output_dir = Config.OUTPUT_DIR
-        self.temp_dir = Config.TEMP_DIR
-        self.ref_dir = Config.REFERENCE_DIR
+        self.output_dir = Path(Config.OUTPUT_DIR)
+        self.temp_dir = Path(Config.TEMP_DIR)
+        self.ref_dir = Path(Config.REFERENCE_DIR)
         
         # Load reference videos
         self.reference_videos = self._load_references()
         
+        # With 3 or fewer refs every character uses all of them, so skip sampling
+        self._ref_pool_size = min(3, len(self.reference_videos))
+        self._fixed_refs = (
+            tuple(self.reference_videos) if len(self.reference_videos) <= 3 else None
+        )
+        
         # Results tracking
         self.results = []
+        
+        # Set by the job doc listener when the job is cancelled (see _is_cancelled)
+        self._cancelled = threading.Event()
+        self._watch = None
     
-    def _load_references(self) -> List[str]:
+    def _load_references(self) -> List[Ref]:
         """Load reference videos from mounted directory"""
         if self.config.reference_videos:
-            return self.config.reference_videos
+            return [Ref(path=p, name=os.path.basename(p)) for p in self.config.reference_videos]
         
         # Look in reference directory
-        ref_files = []
-        if os.path.exists(self.ref_dir):
-            ref_files = [
-                os.path.join(self.ref_dir, f)
-                for f in os.listdir(self.ref_dir)
-                if f.endswith('.mp4')
-            ]
-        
+        ref_files = self._scan_mp4(self.ref_dir)
+
         # Fallback to temp_process_kling if mounted
         if not ref_files:
-            fallback_dir = os.path.join(ROOT, 'temp_process_kling')
-            if os.path.exists(fallback_dir):
-                ref_files = [
-                    os.path.join(fallback_dir, f)
-                    for f in os.listdir(fallback_dir)
-                    if f.endswith('.mp4')
-                ]
-        
+            ref_files = self._scan_mp4(ROOT / 'temp_process_kling')
+
         return ref_files
+
+    @staticmethod
+    def _scan_mp4(directory: Path) -> List[Ref]:
+        """List .mp4 files in a directory (empty list if it doesn't exist)"""
+        try:
+            with os.scandir(directory) as it:
+                return [
+                    Ref(path=e.path, name=e.name) for e in it
+                    if e.name.endswith('.mp4') and e.is_file(follow_symlinks=False)
+                ]
+        except FileNotFoundError:
+            return []
     
     def execute(self) -> Dict[str, Any]:
         """
@@ -78,16 +123,18 @@ class PipelineExecutor:
         Returns:
             Dict with execution results
         """
-        print(f"\n{'='*60}")
-        print(f"🚀 PIPELINE EXECUTOR STARTED")
-        print(f"   Job ID: {self.job_id}")
-        print(f"   Config: {self.config.to_dict()}")
-        print(f"{'='*60}\n")
+        logger.info("\n".join([
+            "🚀 PIPELINE EXECUTOR STARTED",
+            f"   Job ID: {self.job_id}",
+            f"   Config: {self.config.to_dict()}"
+        ]))
         
         if not self.reference_videos:
             raise ValueError("No reference videos found. Please mount reference videos.")
         
-        print(f"📂 Found {len(self.reference_videos)} reference videos")
+        logger.info(f"📂 Found {len(self.reference_videos)} reference videos")
+        
+        self._start_cancel_watch()
         
         try:
             self.tracker.update_status('running', 'Starting pipeline execution')
@@ -111,75 +158,83 @@ class PipelineExecutor:
             
         except Exception as e:
             error_msg = str(e)
-            print(f"\n❌ PIPELINE FAILED: {error_msg}")
-            self.tracker.update_status('failed', error_msg)
+            logger.error(f"❌ PIPELINE FAILED: {error_msg}")
             self.tracker.add_error(error_msg)
+            self.tracker.update_status('failed', error_msg)
             raise
+        
+        finally:
+            if self._watch is not None:
+                self._watch.unsubscribe()
+                self._watch = None
     
     def _resume_pending_characters(self):
         """Resume characters that have cosplay but no dance"""
-        print("\n🔍 Checking for pending characters...")
+        logger.debug("🔍 Checking for pending characters...")
         
-        db = load_db()
         pending = []
         
-        for entry in db:
-            char_id = entry.get('id')
-            assets = entry.get('assets', [])
-            primary = next((a for a in assets if a.get('title') == 'primary'), None)
+        # Streamed, so only the pending tuples are held in memory
+        for entry in iter_db():
+            if not entry.get('assets'):
+                continue
+            primary = _assets_by_title(entry).get('primary')
             
             if primary:
                 cosplay = primary.get('cosplay_image')
-                dance = primary.get('dance_video')
                 
-                # Check if local files exist
-                if cosplay and os.path.exists(cosplay) and not dance:
+                # File presence is checked when the character is processed
+                if cosplay and not primary.get('dance_video'):
+                    char_id = entry.get('id')
                     pending.append((char_id, cosplay, entry.get('name', char_id)))
         
         if not pending:
-            print("   No pending characters found")
+            logger.debug("No pending characters found")
             return
         
-        print(f"   Found {len(pending)} pending characters")
+        logger.info(f"Found {len(pending)} pending characters")
         
         for char_id, cosplay_img, name in pending:
             if self._is_cancelled():
                 return
             
-            print(f"\n🎬 [RESUME] Processing: {name}")
+            logger.info(f"🎬 [RESUME] Processing: {name}")
             self.tracker.update_progress(
                 current_character=name,
                 current_stage='dance_generation (resumed)'
             )
             
             # Generate 3 dance versions with different refs
-            self._generate_dance_versions(char_id, cosplay_img, is_resume=True)
+            try:
+                self._generate_dance_versions(char_id, cosplay_img, is_resume=True)
+            except FileNotFoundError:
+                logger.warning(f"⚠️ Cosplay image not found for {char_id}, skipping")
     
     def _generate_new_characters(self):
         """Generate new characters with full pipeline"""
-        print(f"\n🧠 Generating {self.config.count} new characters...")
+        from workflows.character_gen import generate_characters, generate_new_targets_list
+        from services.gemini_service import GeminiService
+        
+        logger.info(f"🧠 Generating {self.config.count} new characters...")
         
         # Get existing names
-        db = load_db()
-        existing_names = {e.get('name') for e in db}
+        existing_names = {e['name'] for e in iter_db() if 'name' in e}
         
         # Brainstorm new targets
         service = GeminiService()
         targets = generate_new_targets_list(service, existing_names, self.config.count)
         
         if not targets:
-            print("⚠️ No new characters brainstormed")
+            logger.warning("⚠️ No new characters brainstormed")
             return
         
-        print(f"   Brainstormed {len(targets)} characters: {[t[0] for t in targets]}")
+        logger.info(f"Brainstormed {len(targets)} characters: {[t[0] for t in targets]}")
         
         for i, (name, anime) in enumerate(targets):
             if self._is_cancelled():
                 return
             
-            print(f"\n{'='*60}")
-            print(f"✨ CHARACTER {i+1}/{len(targets)}: {name} ({anime})")
-            print(f"{'='*60}")
+            logger.info(f"✨ CHARACTER {i+1}/{len(targets)}: {name} ({anime})")
             
             self.tracker.update_progress(
                 current_character=name,
@@ -192,7 +247,7 @@ class PipelineExecutor:
             char_ids = generate_characters(target_list=[(name, anime)])
             
             if not char_ids:
-                print(f"   ⚠️ Character generation failed for {name}")
+                logger.warning(f"⚠️ Character generation failed for {name}")
                 self.tracker.add_error(f"Character generation failed: {name}")
                 continue
             
@@ -200,23 +255,24 @@ class PipelineExecutor:
             entry = get_entry(char_id)
             
             if not entry:
-                print(f"   ⚠️ Failed to get entry for {char_id}")
+                logger.warning(f"⚠️ Failed to get entry for {char_id}")
                 continue
             
             # Get character image
-            primary_asset = next(
-                (a for a in entry.get('assets', []) if a.get('title') == 'primary'),
-                None
-            )
+            primary_asset = _assets_by_title(entry).get('primary')
             char_img = primary_asset.get('anime_image') if primary_asset else None
             
-            if not char_img or not os.path.exists(char_img):
-                print(f"   ⚠️ Character image not found for {char_id}")
+            if not char_img:
+                logger.warning(f"⚠️ Character image not found for {char_id}")
                 continue
             
             # Phase B: Generate 3 dance versions
-            print(f"\n🎬 Generating 3 dance versions for {name}...")
-            self._generate_dance_versions(char_id, char_img, is_resume=False)
+            logger.debug(f"🎬 Generating 3 dance versions for {name}...")
+            try:
+                self._generate_dance_versions(char_id, char_img, is_resume=False)
+            except FileNotFoundError:
+                logger.warning(f"⚠️ Character image not found for {char_id}")
+                continue
             
             # Track result
             result = {
@@ -232,48 +288,57 @@ class PipelineExecutor:
     def _generate_dance_versions(self, char_id: str, char_img: str, is_resume: bool = False):
         """
         Generate 3 dance versions with different reference videos
+        
+        Raises:
+            FileNotFoundError: If char_img does not exist
         """
+        from workflows.main_pipeline import run_end_to_end_pipeline
+        
+        # Single stat right before the image is consumed (the listing scans don't check)
+        if not os.path.isfile(char_img):
+            raise FileNotFoundError(char_img)
+        
         # Pick 3 random references (or as many as available)
-        num_versions = min(3, len(self.reference_videos))
-        refs = random.sample(self.reference_videos, num_versions)
+        num_versions = self._ref_pool_size
+        refs = self._fixed_refs or random.sample(self.reference_videos, num_versions)
         
         dances_generated = []
         
-        for i, ref_video in enumerate(refs):
+        for i, ref in enumerate(refs):
             if self._is_cancelled():
                 return
             
-            ref_name = os.path.basename(ref_video)
+            ref_name = ref.name
             stage = f'dance_generation_v{i+1}'
             
-            print(f"\n   🎵 Dance Version {i+1}/{num_versions}: Using {ref_name}")
+            logger.info(f"🎵 Dance Version {i+1}/{num_versions}: Using {ref_name}")
             self.tracker.update_progress(current_stage=stage)
             
             try:
                 # Run full pipeline (dance + remix + watermark + soundtracks)
                 deliverable = run_end_to_end_pipeline(
                     char_img=char_img,
-                    ref_video=ref_video,
+                    ref_video=ref.path,
                     char_id=char_id,
                     reuse_cosplay=True,
                     style_id=self.config.style_id
                 )
                 
                 if deliverable and os.path.exists(deliverable):
-                    print(f"   ✅ Deliverable: {os.path.basename(deliverable)}")
+                    logger.info(f"✅ Deliverable: {Path(deliverable).name}")
                     dances_generated.append({
                         'version': i+1,
                         'reference': ref_name,
                         'deliverable': deliverable
                     })
                 else:
-                    print(f"   ⚠️ No deliverable for version {i+1}")
+                    logger.warning(f"⚠️ No deliverable for version {i+1}")
                     
             except Exception as e:
-                print(f"   ❌ Error in dance version {i+1}: {e}")
+                logger.error(f"❌ Error in dance version {i+1}: {e}")
                 self.tracker.add_error(f"Dance v{i+1} failed for {char_id}: {e}")
         
-        print(f"\n   📊 Generated {len(dances_generated)}/{num_versions} dance versions")
+        logger.info(f"📊 Generated {len(dances_generated)}/{num_versions} dance versions")
         
         # If this was a new character, run soundtrack remix batch
         if not is_resume and dances_generated and self.config.create_soundtracks:
@@ -281,39 +346,51 @@ class PipelineExecutor:
     
     def _create_soundtrack_versions(self, char_id: str, deliverable_path: str):
         """Create dual soundtrack versions (kpop/orig)"""
-        print(f"\n🎶 Creating soundtrack versions...")
+        logger.info("🎶 Creating soundtrack versions...")
         self.tracker.update_progress(current_stage='soundtrack_generation')
         
         try:
             from workflows.batch_soundtrack_remix import process_remix_folder
             
             # Find remix folder from deliverable path
-            remix_dir = os.path.dirname(deliverable_path)
-            if os.path.basename(remix_dir) == 'result':
-                remix_dir = os.path.dirname(remix_dir)
+            remix_dir = Path(deliverable_path).parent
+            if remix_dir.name == 'result':
+                remix_dir = remix_dir.parent
             
-            if os.path.exists(remix_dir):
-                process_remix_folder(remix_dir, style_id=self.config.style_id)
+            if remix_dir.is_dir():
+                process_remix_folder(str(remix_dir), style_id=self.config.style_id)
             else:
-                print(f"   ⚠️ Remix folder not found: {remix_dir}")
+                logger.warning(f"⚠️ Remix folder not found: {remix_dir}")
                 
         except Exception as e:
-            print(f"   ⚠️ Soundtrack generation failed: {e}")
+            logger.warning(f"⚠️ Soundtrack generation failed: {e}")
             self.tracker.add_error(f"Soundtrack failed for {char_id}: {e}")
     
+    def _start_cancel_watch(self):
+        """Listen for cancellation on the job doc rather than reading it at every step"""
+        def on_change(job):
+            if job and job.get('status') == 'cancelled':
+                self._cancelled.set()
+        
+        try:
+            self._watch = self.tracker.watch(on_change)
+        except Exception as e:
+            logger.warning(f"⚠️ Job listener unavailable, polling for cancellation: {e}")
+    
     def _is_cancelled(self) -> bool:
         """Check if job has been cancelled"""
+        if self._watch is not None:
+            return self._cancelled.is_set()
         job = self.tracker.get_job()
         return job and job.get('status') == 'cancelled'
     
     def cleanup(self):
         """Clean up temporary files"""
-        print("\n🧹 Cleaning up temporary files...")
+        logger.debug("🧹 Cleaning up temporary files...")
         try:
             # Keep output but clean temp
-            if os.path.exists(self.temp_dir):
-                shutil.rmtree(self.temp_dir)
-                os.makedirs(self.temp_dir, exist_ok=True)
-            print("   ✅ Cleanup complete")
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+            os.makedirs(self.temp_dir, exist_ok=True)
+            logger.debug("✅ Cleanup complete")
         except Exception as e:
-            print(f"   ⚠️ Cleanup error: {e}")
+            logger.warning(f"⚠️ Cleanup error: {e}")
@@ -2,8 +2,21 @@
 API Routes for Full Pipeline Service
 """
 import os
+import hmac
+import atexit
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
 from functools import wraps
-from flask import Blueprint, request, jsonify
+from typing import Annotated, Dict, List, Optional
+import httpx
+import msgspec
+from flask import Blueprint, Response, request, jsonify
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 from config import Config, PipelineConfig
 from services.job_tracker import JobTracker
@@ -11,15 +24,72 @@ from executor.pipeline_executor import PipelineExecutor
 
 api_bp = Blueprint('api', __name__)
 
+class RunOptions(msgspec.Struct):
+    """Options block of a /pipeline/run request"""
+    skip_existing: bool = True
+    generate_variants: bool = True
+    create_soundtracks: bool = True
+    apply_watermark: bool = True
+
+
+class RunRequest(msgspec.Struct):
+    """/pipeline/run request body (parsed and validated in one msgspec call)"""
+    count: Annotated[int, msgspec.Meta(ge=1, le=Config.MAX_COUNT)]
+    style_id: str = Config.DEFAULT_STYLE_ID
+    reference_videos: List[str] = []
+    webhook_url: Optional[str] = None
+    options: RunOptions = msgspec.field(default_factory=RunOptions)
+
+
+# Encoded once so auth checks don't re-encode per request
+_API_KEY = (Config.API_KEY or '').encode()
+
+# Bounded worker pool for pipeline jobs (extra jobs wait in the queue)
+EXECUTOR = ThreadPoolExecutor(
+    max_workers=Config.MAX_CONCURRENT_JOBS,
+    thread_name_prefix='pipeline'
+)
+atexit.register(EXECUTOR.shutdown, wait=False)
+
+# Webhooks are delivered by a shared async client on one event-loop thread,
+# so pipeline workers don't block on the HTTP call and connections are reused
+_webhook_loop: Optional[asyncio.AbstractEventLoop] = None
+_webhook_client: Optional[httpx.AsyncClient] = None
+_webhook_lock = threading.Lock()
+
+# job_id -> Future, so queued jobs can be cancelled before they start
+_job_futures: Dict[str, Future] = {}
+_job_futures_lock = threading.Lock()
+
+
+def _forget_job(job_id: str):
+    with _job_futures_lock:
+        _job_futures.pop(job_id, None)
+
+
+def fast_jsonify(obj, status: int = 200):
+    """jsonify() replacement that serializes with orjson (falls back to Flask's encoder)"""
+    if orjson is None:
+        return jsonify(obj), status
+    return Response(
+        orjson.dumps(obj, default=str),
+        status=status,
+        mimetype='application/json'
+    )
+
 
 def require_api_key(f):
     """Decorator to require API key authentication"""
     @wraps(f)
     def decorated(*args, **kwargs):
         auth_header = request.headers.get('Authorization', '')
-        api_key = auth_header.replace('Bearer ', '') if auth_header.startswith('Bearer ') else None
         
-        if not api_key or api_key != Config.API_KEY:
+        # Constant-time compare to avoid leaking the key through timing
+        if (
+            not _API_KEY
+            or not auth_header.startswith('Bearer ')
+            or not hmac.compare_digest(auth_header[7:].encode(), _API_KEY)
+        ):
             return jsonify({
                 'success': False,
                 'error': 'Unauthorized. Valid API key required.'
@@ -74,32 +144,24 @@ def run_pipeline():
     }
     """
     try:
-        data = request.get_json()
-        
-        # Validate required fields
-        if 'count' not in data:
+        # Parse + validate body (count is required, 1..MAX_COUNT)
+        try:
+            run_request = msgspec.json.decode(request.get_data(), type=RunRequest)
+        except (msgspec.ValidationError, msgspec.DecodeError) as e:
             return jsonify({
                 'success': False,
-                'error': 'Missing required field: count'
-            }), 400
-        
-        # Validate count
-        count = data.get('count', 1)
-        if not isinstance(count, int) or count < 1 or count > Config.MAX_COUNT:
-            return jsonify({
-                'success': False,
-                'error': f'Invalid count. Must be between 1 and {Config.MAX_COUNT}'
+                'error': f'Invalid request: {e}'
             }), 400
+        count = run_request.count
         
         # Create pipeline config
-        config = PipelineConfig(data)
+        config = PipelineConfig.from_request(msgspec.to_builtins(run_request))
         
         # Create job tracker
         tracker = JobTracker()
         job_id = tracker.create_job(config.to_dict())
         
         # Start pipeline execution in background
-        import threading
         def run_async():
             try:
                 executor = PipelineExecutor(job_id, config)
@@ -115,8 +177,8 @@ def run_pipeline():
                     
             except Exception as e:
                 print(f"[Pipeline] Job {job_id} failed: {e}")
-                tracker.update_status('failed', str(e))
                 tracker.add_error(str(e))
+                tracker.update_status('failed', str(e))
                 
                 if config.webhook_url:
                     _call_webhook(config.webhook_url, {
@@ -125,8 +187,10 @@ def run_pipeline():
                         'error': str(e)
                     })
         
-        thread = threading.Thread(target=run_async, daemon=True)
-        thread.start()
+        future = EXECUTOR.submit(run_async)
+        with _job_futures_lock:
+            _job_futures[job_id] = future
+        future.add_done_callback(lambda _: _forget_job(job_id))
         
         return jsonify({
             'success': True,
@@ -149,7 +213,7 @@ def get_status(job_id):
     """Get pipeline job status"""
     try:
         tracker = JobTracker(job_id)
-        job = tracker.get_job()
+        job = tracker.get_job(include_results=True)
         
         if not job:
             return jsonify({
@@ -157,7 +221,7 @@ def get_status(job_id):
                 'error': 'Job not found'
             }), 404
         
-        return jsonify({
+        return fast_jsonify({
             'success': True,
             'job': job
         })
@@ -176,10 +240,12 @@ def list_jobs():
     try:
         status = request.args.get('status')
         limit = int(request.args.get('limit', 10))
+        # ?summary=1 returns only JobTracker.LIST_FIELDS per job
+        fields = JobTracker.LIST_FIELDS if request.args.get('summary') else None
         
-        jobs = JobTracker.list_jobs(status=status, limit=limit)
+        jobs = JobTracker.list_jobs(status=status, limit=limit, fields=fields)
         
-        return jsonify({
+        return fast_jsonify({
             'success': True,
             'jobs': jobs,
             'count': len(jobs)
@@ -212,6 +278,12 @@ def cancel_job(job_id):
                 'error': f'Job already {job["status"]}'
             }), 400
         
+        # Drop the job from the pool queue if it hasn't started yet
+        with _job_futures_lock:
+            future = _job_futures.get(job_id)
+        if future is not None:
+            future.cancel()
+        
         success = tracker.cancel()
         
         if success:
@@ -253,7 +325,7 @@ def list_characters():
                 'updated_at': char.get('updated_at')
             })
         
-        return jsonify({
+        return fast_jsonify({
             'success': True,
             'characters': simplified,
             'count': len(simplified)
@@ -266,15 +338,29 @@ def list_characters():
         }), 500
 
 
-def _call_webhook(url: str, payload: dict):
-    """Call webhook URL with payload"""
+def _get_webhook_loop() -> asyncio.AbstractEventLoop:
+    """Start the webhook event loop thread on first use"""
+    global _webhook_loop, _webhook_client
+    with _webhook_lock:
+        if _webhook_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='webhook-loop', daemon=True).start()
+            _webhook_client = httpx.AsyncClient(
+                http2=True,
+                timeout=httpx.Timeout(30, connect=5),
+                limits=httpx.Limits(max_connections=32)
+            )
+            _webhook_loop = loop
+    return _webhook_loop
+
+
+async def _post_webhook(url: str, payload: dict):
     try:
-        import requests
-        requests.post(
-            url,
-            json=payload,
-            headers={'Content-Type': 'application/json'},
-            timeout=30
-        )
+        await _webhook_client.post(url, json=payload)
     except Exception as e:
         print(f"[Webhook] Failed to call {url}: {e}")
+
+
+def _call_webhook(url: str, payload: dict):
+    """Call webhook URL with payload (returns immediately; delivery is async)"""
+    asyncio.run_coroutine_threadsafe(_post_webhook(url, payload), _get_webhook_loop())
@@ -2,8 +2,10 @@
 Job Tracker - Manages pipeline job state in Firestore
 """
 import uuid
+import threading
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Callable
 
 import sys
 from pathlib import Path
@@ -13,17 +15,60 @@ ROOT = Path(__file__).parent.parent.parent.parent  # up to anime_dance_social_me
 sys.path.insert(0, str(ROOT))
 
 from google.cloud import firestore
-from services.firestore_service import FirestoreService
+from services.firestore_service import FirestoreService, rpc_opts, FS_STREAM_TIMEOUT
 from config import Config
 
 
+@dataclass
+class _PendingWrites:
+    """Job doc updates waiting to be flushed in a single update() call"""
+    fields: Dict[str, Any] = field(default_factory=dict)
+    increments: Dict[str, int] = field(default_factory=dict)
+    results: List[Dict[str, Any]] = field(default_factory=list)
+    errors: List[Dict[str, Any]] = field(default_factory=list)
+    ops: int = 0
+    
+    def to_update(self) -> Dict[str, Any]:
+        """Job doc fields (results/errors go to subcollections, only counted here)"""
+        updates = dict(self.fields)
+        increments = dict(self.increments)
+        if self.results:
+            increments['results_count'] = len(self.results)
+        if self.errors:
+            increments['errors_count'] = len(self.errors)
+        for key, delta in increments.items():
+            updates[key] = firestore.Increment(delta)
+        return updates
+
+
 class JobTracker:
-    """Tracks pipeline job progress in Firestore"""
+    """
+    Tracks pipeline job progress in Firestore.
+    Results and errors are append-only docs in the job's `results`/`errors`
+    subcollections; the job doc only keeps their counts.
+    """
+    
+    RESULTS_SUBCOLLECTION = 'results'
+    ERRORS_SUBCOLLECTION = 'errors'
+    
+    # Buffered progress/result/error writes are flushed after this many
+    # operations, after FLUSH_INTERVAL seconds, or with the next status change
+    FLUSH_EVERY_OPS = 40
+    FLUSH_INTERVAL = 2.0
     
     def __init__(self, job_id: Optional[str] = None):
         self.job_id = job_id or str(uuid.uuid4())
         self.fs = FirestoreService()
         self.collection = self.fs.db.collection(Config.FIRESTORE_COLLECTION_JOBS)
+        
+        # Local view of the job doc, so updates don't need a read first.
+        # Populated by create_job()/refresh(); call refresh() if it may be stale.
+        self._progress_cache: Optional[Dict[str, Any]] = None
+        self._started = False
+        
+        self._pending = _PendingWrites()
+        self._pending_lock = threading.Lock()
+        self._flush_timer: Optional[threading.Timer] = None
     
     def create_job(self, config: Dict[str, Any]) -> str:
         """Create a new job document in Firestore"""
@@ -38,32 +83,98 @@ class JobTracker:
                 'current_stage': 'initializing',
                 'percent_complete': 0
             },
-            'results': [],
-            'errors': [],
+            'results_count': 0,
+            'errors_count': 0,
             'created_at': firestore.SERVER_TIMESTAMP,
             'updated_at': firestore.SERVER_TIMESTAMP,
             'started_at': None,
             'completed_at': None
         }
         
-        self.collection.document(self.job_id).set(job_data)
+        self.collection.document(self.job_id).set(job_data, **rpc_opts())
+        self._progress_cache = dict(job_data['progress'])
         print(f"[JobTracker] Created job: {self.job_id}")
         return self.job_id
     
+    def _buffer(self, apply):
+        """Apply a change to the pending buffer and flush if it is full"""
+        with self._pending_lock:
+            apply(self._pending)
+            self._pending.ops += 1
+            full = self._pending.ops >= self.FLUSH_EVERY_OPS
+            if not full and self._flush_timer is None:
+                self._flush_timer = threading.Timer(self.FLUSH_INTERVAL, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+        if full:
+            self.flush()
+    
+    def _take_pending(self) -> _PendingWrites:
+        """Detach and return the pending buffer"""
+        with self._pending_lock:
+            pending, self._pending = self._pending, _PendingWrites()
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+        return pending
+    
+    def _commit(self, pending: _PendingWrites, updates: Dict[str, Any]):
+        """Write job doc updates plus buffered results/errors in one batch"""
+        job_ref = self.collection.document(self.job_id)
+        batch = self.fs.db.batch()
+        batch.update(job_ref, {**pending.to_update(), **updates})
+        for subcollection, entries in (
+            (self.RESULTS_SUBCOLLECTION, pending.results),
+            (self.ERRORS_SUBCOLLECTION, pending.errors)
+        ):
+            for entry in entries:
+                batch.set(
+                    job_ref.collection(subcollection).document(),
+                    {**entry, 'created_at': firestore.SERVER_TIMESTAMP}
+                )
+        batch.commit(**rpc_opts())
+    
+    def flush(self):
+        """Write all buffered progress/results/errors in one batch"""
+        pending = self._take_pending()
+        if not pending.ops:
+            return
+        try:
+            self._commit(pending, {'updated_at': firestore.SERVER_TIMESTAMP})
+        except Exception as e:
+            print(f"[JobTracker] Failed to flush updates for {self.job_id}: {e}")
+    
+    def _claim_start(self) -> bool:
+        """True exactly once per tracker: the caller should write started_at"""
+        with self._pending_lock:
+            if self._started:
+                return False
+            self._started = True
+            return True
+    
+    def mark_started(self):
+        """Set started_at once (no read; later calls are no-ops)"""
+        if self._claim_start():
+            self.collection.document(self.job_id).update({
+                'started_at': firestore.SERVER_TIMESTAMP,
+                'updated_at': firestore.SERVER_TIMESTAMP
+            }, **rpc_opts())
+    
     def update_status(self, status: str, message: Optional[str] = None):
-        """Update job status"""
+        """Update job status (also writes any buffered updates)"""
+        pending = self._take_pending()
         updates = {
             'status': status,
             'updated_at': firestore.SERVER_TIMESTAMP
         }
         if message:
             updates['message'] = message
-        if status == 'running' and not self._get_field('started_at'):
+        if status == 'running' and self._claim_start():
             updates['started_at'] = firestore.SERVER_TIMESTAMP
         if status in ['completed', 'failed']:
             updates['completed_at'] = firestore.SERVER_TIMESTAMP
         
-        self.collection.document(self.job_id).update(updates)
+        self._commit(pending, updates)
         print(f"[JobTracker] Job {self.job_id} status: {status}")
     
     def update_progress(
@@ -73,71 +184,138 @@ class JobTracker:
         completed: Optional[int] = None,
         percent_complete: Optional[int] = None
     ):
-        """Update job progress"""
-        progress = self._get_field('progress') or {}
-        
+        """Update job progress (dotted-field write, no read of the job doc)"""
+        changes = {}
         if current_character:
-            progress['current_character'] = current_character
+            changes['current_character'] = current_character
         if current_stage:
-            progress['current_stage'] = current_stage
+            changes['current_stage'] = current_stage
         if completed is not None:
-            progress['completed'] = completed
+            changes['completed'] = completed
         if percent_complete is not None:
-            progress['percent_complete'] = percent_complete
+            changes['percent_complete'] = percent_complete
         
-        self.collection.document(self.job_id).update({
-            'progress': progress,
-            'updated_at': firestore.SERVER_TIMESTAMP
-        })
+        if not changes:
+            return
+        
+        def apply(pending: _PendingWrites):
+            for k, v in changes.items():
+                pending.fields[f'progress.{k}'] = v
+            if 'completed' in changes:
+                pending.increments.pop('progress.completed', None)
+        self._buffer(apply)
+        
+        if self._progress_cache is not None:
+            self._progress_cache.update(changes)
+    
+    def increment_completed(self, delta: int = 1):
+        """Atomically bump progress.completed"""
+        def apply(pending: _PendingWrites):
+            key = 'progress.completed'
+            if key in pending.fields:
+                pending.fields[key] += delta
+            else:
+                pending.increments[key] = pending.increments.get(key, 0) + delta
+        self._buffer(apply)
+        
+        if self._progress_cache is not None:
+            self._progress_cache['completed'] = self._progress_cache.get('completed', 0) + delta
+    
+    @property
+    def progress(self) -> Dict[str, Any]:
+        """Cached progress dict (loaded from Firestore on first access)"""
+        if self._progress_cache is None:
+            self.refresh()
+        return dict(self._progress_cache or {})
+    
+    def refresh(self) -> Optional[Dict[str, Any]]:
+        """Reload the job doc and reset the local progress/started_at cache"""
+        job = self.get_job()
+        if job:
+            self._progress_cache = dict(job.get('progress') or {})
+            self._started = bool(job.get('started_at'))
+        return job
     
     def add_character_result(self, character_data: Dict[str, Any]):
         """Add a completed character result"""
-        self.collection.document(self.job_id).update({
-            'results': firestore.ArrayUnion([character_data]),
-            'updated_at': firestore.SERVER_TIMESTAMP
-        })
+        self._buffer(lambda pending: pending.results.append(character_data))
     
     def add_error(self, error: str):
         """Add an error message"""
-        self.collection.document(self.job_id).update({
-            'errors': firestore.ArrayUnion([{
-                'message': error,
-                'timestamp': datetime.utcnow().isoformat()
-            }]),
-            'updated_at': firestore.SERVER_TIMESTAMP
-        })
-    
-    def get_job(self) -> Optional[Dict[str, Any]]:
-        """Get job document"""
-        doc = self.collection.document(self.job_id).get()
-        if doc.exists:
-            return doc.to_dict()
-        return None
-    
-    def _get_field(self, field: str) -> Any:
-        """Get a specific field from job document"""
-        doc = self.collection.document(self.job_id).get()
-        if doc.exists:
-            return doc.to_dict().get(field)
-        return None
+        entry = {
+            'message': error,
+            'timestamp': datetime.utcnow().isoformat()
+        }
+        self._buffer(lambda pending: pending.errors.append(entry))
+    
+    def get_job(self, include_results: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Get job document
+        
+        Args:
+            include_results: Also stream the results/errors subcollections into
+                             'results'/'errors' lists (oldest first)
+        """
+        doc = self.collection.document(self.job_id).get(**rpc_opts())
+        if not doc.exists:
+            return None
+        job = doc.to_dict()
+        if include_results:
+            job['results'] = self.get_results()
+            job['errors'] = self.get_errors()
+        return job
+    
+    def watch(self, callback: Callable[[Optional[Dict[str, Any]]], None]):
+        """
+        Subscribe to job doc changes instead of polling get_job().
+        callback receives the job dict (None if the doc is deleted) on each change,
+        from a listener thread.
+        
+        Returns:
+            Watch handle; call .unsubscribe() to stop
+        """
+        def on_snapshot(snapshots, changes, read_time):
+            for snap in snapshots:
+                callback(snap.to_dict() if snap.exists else None)
+        
+        return self.collection.document(self.job_id).on_snapshot(on_snapshot)
+    
+    def _stream_subcollection(self, name: str) -> List[Dict[str, Any]]:
+        query = self.collection.document(self.job_id).collection(name).order_by('created_at')
+        return [doc.to_dict() for doc in query.stream(**rpc_opts(FS_STREAM_TIMEOUT))]
+    
+    def get_results(self) -> List[Dict[str, Any]]:
+        """Character results recorded for this job"""
+        return self._stream_subcollection(self.RESULTS_SUBCOLLECTION)
+    
+    def get_errors(self) -> List[Dict[str, Any]]:
+        """Errors recorded for this job"""
+        return self._stream_subcollection(self.ERRORS_SUBCOLLECTION)
+    
+    # Summary projection for list_jobs(fields=...) callers that don't need full docs
+    LIST_FIELDS = ('job_id', 'status', 'progress.percent_complete', 'created_at')
     
     @staticmethod
     def list_jobs(
         status: Optional[str] = None,
         limit: int = 10,
-        order_by: str = 'created_at'
+        order_by: str = 'created_at',
+        fields: Optional[List[str]] = None
     ) -> List[Dict[str, Any]]:
-        """List jobs with optional filtering"""
+        """List jobs with optional filtering (optionally only `fields`)"""
         fs = FirestoreService()
         query = fs.db.collection(Config.FIRESTORE_COLLECTION_JOBS)
         
         if status:
             query = query.where('status', '==', status)
         
+        if fields:
+            query = query.select(list(fields))
+        
         query = query.order_by(order_by, direction=firestore.Query.DESCENDING)
         query = query.limit(limit)
         
-        return [doc.to_dict() for doc in query.stream()]
+        return [doc.to_dict() for doc in query.stream(**rpc_opts(FS_STREAM_TIMEOUT))]
     
     def cancel(self) -> bool:
         """Mark job as cancelled"""
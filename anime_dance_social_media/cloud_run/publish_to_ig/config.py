@@ -4,12 +4,14 @@ Centralizes environment variables and cloud configuration.
 """
 import os
 from pathlib import Path
-from dotenv import load_dotenv
 
-# Load .env from project root
+# Load .env from project root (once per process; skipped if already loaded)
 PROJECT_ROOT = Path(__file__).parent.parent
 ENV_PATH = PROJECT_ROOT / ".env"
-load_dotenv(ENV_PATH)
+if not os.getenv("CONFIG_LOADED"):
+    from dotenv import load_dotenv
+    load_dotenv(ENV_PATH)
+    os.environ["CONFIG_LOADED"] = "1"
 
 
 class Config:
@@ -28,6 +30,10 @@ class Config:
     GCS_BUCKET_NAME = os.getenv("GCS_BUCKET_NAME", "nisan-n8n")
     GCS_BASE_PREFIX = "anime_dance"
     
+    # Precomputed for get_gcs_path/get_local_path
+    _GCS_PREFIX = f"gs://{GCS_BUCKET_NAME}/{GCS_BASE_PREFIX}/"
+    _OUTPUT_STR = OUTPUT_DIR.as_posix() + "/"
+    
     # Service account credentials
     GOOGLE_APPLICATION_CREDENTIALS = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
     FIRESTORE_DATABASE = os.getenv("FIRESTORE_DATABASE", "(default)")
@@ -57,15 +63,14 @@ class Config:
     @classmethod
     def get_gcs_path(cls, local_path: str) -> str:
         """Convert a local path to GCS path."""
-        path = Path(local_path)
+        posix_path = str(local_path).replace(os.sep, "/")
+        
+        # Relative path from output directory
+        if posix_path.startswith(cls._OUTPUT_STR):
+            return cls._GCS_PREFIX + posix_path[len(cls._OUTPUT_STR):]
         
-        # Find relative path from output directory
-        try:
-            relative = path.relative_to(cls.OUTPUT_DIR)
-            return f"gs://{cls.GCS_BUCKET_NAME}/{cls.GCS_BASE_PREFIX}/{relative.as_posix()}"
-        except ValueError:
-            # Path is not under OUTPUT_DIR
-            return f"gs://{cls.GCS_BUCKET_NAME}/{cls.GCS_BASE_PREFIX}/{path.name}"
+        # Path is not under OUTPUT_DIR
+        return cls._GCS_PREFIX + posix_path.rsplit("/", 1)[-1]
     
     @classmethod
     def get_local_path(cls, gcs_uri: str) -> Path:
@@ -76,7 +81,7 @@ class Config:
             return Path(gcs_uri)
         
         # Extract path after bucket/prefix
-        parts = gcs_uri.replace(f"gs://{cls.GCS_BUCKET_NAME}/{cls.GCS_BASE_PREFIX}/", "")
+        parts = gcs_uri.removeprefix(cls._GCS_PREFIX)
         return cls.OUTPUT_DIR / parts.replace("/", os.sep)
     
     @classmethod
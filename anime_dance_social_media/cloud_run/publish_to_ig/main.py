@@ -1,5 +1,9 @@
 import os
+import json
+import time
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from flask import Flask, request, jsonify
 from datetime import datetime
 
@@ -8,9 +12,17 @@ import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent))
 
-from services.gcs_service import GCSService
-from services.firestore_service import FirestoreService
-from services.instagram_service import InstagramService
+from services.gcs_service import get_gcs_service
+from services.firestore_service import get_firestore_service
+from services.instagram_service import get_instagram_service
+
+from google.auth.transport import requests as google_requests
+from google.oauth2 import id_token
+
+try:
+    from google.cloud import tasks_v2
+except ImportError:
+    tasks_v2 = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -18,6 +30,60 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+# Background pool for writes the HTTP response doesn't depend on
+_background = ThreadPoolExecutor(max_workers=8, thread_name_prefix='publish-bg')
+
+
+def _log_post_saved(future):
+    error = future.exception()
+    if error:
+        logger.error(f"Failed to save Instagram post record: {error}")
+
+
+# Signed URLs are minted for 1h; reuse them for 55 min so a repeat publish of
+# the same video skips the signing call
+SIGNED_URL_TTL = 55 * 60
+SIGNED_URL_CACHE_SIZE = 1024
+_signed_urls = {}
+_signed_urls_lock = threading.Lock()
+
+
+def _get_signed_url(gcs_uri):
+    """1-hour signed URL for a GCS object, memoized per URI."""
+    now = time.monotonic()
+    with _signed_urls_lock:
+        cached = _signed_urls.get(gcs_uri)
+        if cached and cached[0] > now:
+            return cached[1]
+    
+    url = get_gcs_service().get_signed_url(gcs_uri, expiration_hours=1)
+    with _signed_urls_lock:
+        if len(_signed_urls) >= SIGNED_URL_CACHE_SIZE:
+            _signed_urls.clear()
+        _signed_urls[gcs_uri] = (now + SIGNED_URL_TTL, url)
+    return url
+
+
+# Cloud Tasks queue for /publish (projects/<p>/locations/<l>/queues/<q>) and
+# the URL of this service's /publish/worker. Unset = publish synchronously.
+PUBLISH_TASKS_QUEUE = os.environ.get('PUBLISH_TASKS_QUEUE')
+PUBLISH_WORKER_URL = os.environ.get('PUBLISH_WORKER_URL')
+PUBLISH_TASKS_SERVICE_ACCOUNT = os.environ.get('PUBLISH_TASKS_SERVICE_ACCOUNT')
+# Cloud Scheduler's OIDC identity and the full URL of /rerandomize (the token
+# audience). Both are required; /rerandomize is disabled without them.
+SCHEDULER_SERVICE_ACCOUNT = os.environ.get('SCHEDULER_SERVICE_ACCOUNT')
+RERANDOMIZE_URL = os.environ.get('RERANDOMIZE_URL')
+
+# Reused for OIDC verification (fetching Google's certs) across requests
+_auth_request = google_requests.Request()
+_tasks_client = None
+
+
+def _save_post_async(**post):
+    """Record a published post in Firestore without blocking the response."""
+    future = _background.submit(get_firestore_service().save_instagram_post, **post)
+    future.add_done_callback(_log_post_saved)
+
 @app.route('/publish', methods=['POST'])
 def publish_to_instagram():
     """
@@ -29,6 +95,9 @@ def publish_to_instagram():
         "version": "remix_kpop_watermarked",  # optional: remix_kpop_watermarked, remix_orig_watermarked, remix_structured_watermarked
         "caption": "Check out this dance! #anime #dance"  # optional
     }
+    
+    With a Cloud Tasks queue configured, the post is queued and handled by
+    /publish/worker; the response is 202 with the post record ID as job_id.
     """
     data = request.get_json()
     if not data:
@@ -43,62 +112,178 @@ def publish_to_instagram():
         return jsonify({"error": "character_id is required"}), 400
 
     try:
-        # 1. Initialize services
-        gcs = GCSService()
-        firestore = FirestoreService()
-        instagram = InstagramService()
-
-        # 2. Get character data from Firestore
-        char = firestore.get_character(char_id)
-        if not char:
-            return jsonify({"error": f"Character {char_id} not found"}), 404
-
-        # 3. Find the asset
-        asset = next((a for a in char.get("assets", []) if a.get("title") == asset_title), None)
-        if not asset:
-            return jsonify({"error": f"Asset {asset_title} not found for character {char_id}"}), 404
-
-        # 4. Get the video URI (GCS path)
-        gcs_uri = asset.get(version)
-        if not gcs_uri:
-            # Fallback to standard dance_video if specific remix version is not found
-            gcs_uri = asset.get("dance_video")
-            logger.warning(f"Version {version} not found. Falling back to dance_video.")
-
-        if not gcs_uri:
-            return jsonify({"error": f"No video found for version {version} or dance_video"}), 404
-
-        # 5. Generate a signed URL for Instagram (needs to be public)
-        # Instagram prefers a public URL. Signed URLs work if active.
-        video_url = gcs.get_signed_url(gcs_uri, expiration_hours=1)
-        
-        # 6. Prepare caption
-        caption = custom_caption or f"{char.get('name')} from {char.get('anime')}! #anime #dance #cosplay"
-
-        # 7. Publish to Instagram
-        logger.info(f"Publishing {char_id} ({version}) to Instagram...")
-        result = instagram.publish_reel(
-            video_url=video_url,
-            caption=caption
-        )
-
-        if result.get("success"):
-            # 8. Log the post in Firestore
-            firestore.save_instagram_post(
+        if _publish_queue_enabled():
+            # Record the post as queued, then hand the IG round-trip to the worker
+            job_id = get_firestore_service().save_instagram_post(
                 char_id=char_id,
                 asset_title=asset_title,
-                media_url=gcs_uri,
-                status="published",
-                post_id=result.get("media_id")
+                media_url=None,
+                status="queued"
             )
-            return jsonify(result), 200
-        else:
-            return jsonify(result), 500
+            _enqueue_publish({
+                "job_id": job_id,
+                "character_id": char_id,
+                "asset_title": asset_title,
+                "version": version,
+                "caption": custom_caption
+            })
+            return jsonify({"job_id": job_id, "status": "queued"}), 202
+        
+        body, status = _publish_reel(char_id, asset_title, version, custom_caption)
+        return jsonify(body), status
 
     except Exception as e:
         logger.error(f"Error publishing: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/publish/worker', methods=['POST'])
+def publish_worker():
+    """
+    Cloud Tasks target for queued /publish requests.
+    Publishes the reel and updates the queued post record with the outcome.
+    Returns 5xx only for errors worth retrying.
+    """
+    if not _verify_oidc_token(PUBLISH_TASKS_SERVICE_ACCOUNT, PUBLISH_WORKER_URL):
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    data = request.get_json() or {}
+    job_id = data.get("job_id")
+    if not job_id or not data.get("character_id"):
+        return jsonify({"error": "job_id and character_id are required"}), 400
+    
+    firestore = get_firestore_service()
+    try:
+        post = firestore.get_instagram_post(job_id)
+        if post and (post.get("status") == "published" or post.get("post_id")):
+            # Redelivered task for a reel that already went out
+            return jsonify({"job_id": job_id, "status": "published", "skipped": True}), 200
+        
+        firestore.update_instagram_post(job_id, {"status": "processing"})
+        body, status = _publish_reel(
+            data["character_id"],
+            data.get("asset_title", "primary"),
+            data.get("version", "remix_kpop_watermarked"),
+            data.get("caption"),
+            post_doc_id=job_id
+        )
+        if status != 200:
+            firestore.update_instagram_post(job_id, {"status": "failed", "error": body.get("error")})
+        # Missing character/asset won't fix itself on retry
+        return jsonify(body), 200 if status == 404 else status
+
+    except Exception as e:
+        logger.error(f"Error in publish worker ({job_id}): {e}")
+        return jsonify({"error": str(e)}), 500
+
+def _publish_reel(char_id, asset_title, version, custom_caption=None, post_doc_id=None):
+    """
+    Resolve the asset video, publish it to Instagram and record the post.
+    
+    Returns:
+        (response body, HTTP status)
+    """
+    # 1. Get services (module-level singletons, reused across requests)
+    firestore = get_firestore_service()
+    instagram = get_instagram_service()
+
+    # 2. Get character data from Firestore
+    char = firestore.get_character(char_id)
+    if not char:
+        return {"error": f"Character {char_id} not found"}, 404
+
+    # 3. Find the asset (single doc read from the assets subcollection)
+    asset = firestore.get_character_asset(char_id, asset_title)
+    if not asset:
+        return {"error": f"Asset {asset_title} not found for character {char_id}"}, 404
+
+    # 4. Get the video URI (GCS path)
+    gcs_uri = asset.get(version)
+    if not gcs_uri:
+        # Fallback to standard dance_video if specific remix version is not found
+        gcs_uri = asset.get("dance_video")
+        logger.warning(f"Version {version} not found. Falling back to dance_video.")
+
+    if not gcs_uri:
+        return {"error": f"No video found for version {version} or dance_video"}, 404
+
+    # 5. Generate a signed URL for Instagram (needs to be public)
+    # Instagram prefers a public URL. Signed URLs work if active.
+    video_url = _get_signed_url(gcs_uri)
+    
+    # 6. Prepare caption
+    caption = custom_caption or f"{char.get('name')} from {char.get('anime')}! #anime #dance #cosplay"
+
+    # 7. Publish to Instagram
+    logger.info(f"Publishing {char_id} ({version}) to Instagram...")
+    result = instagram.publish_reel(
+        video_url=video_url,
+        caption=caption
+    )
+
+    if not result.get("success"):
+        return result, 500
+
+    # 8. Log the post in Firestore
+    if post_doc_id:
+        try:
+            firestore.update_instagram_post(post_doc_id, {
+                "status": "published",
+                "media_url": gcs_uri,
+                "post_id": result.get("media_id"),
+                "published_at": datetime.utcnow()
+            })
+        except Exception as e:
+            # The reel is live; a 5xx here would make Cloud Tasks publish it again
+            logger.error(f"Failed to record published post {post_doc_id}: {e}")
+    else:
+        _save_post_async(
+            char_id=char_id,
+            asset_title=asset_title,
+            media_url=gcs_uri,
+            status="published",
+            post_id=result.get("media_id")
+        )
+    return result, 200
+
+def _verify_oidc_token(service_account, audience):
+    """Check the OIDC token Cloud Tasks/Scheduler attaches to internal requests."""
+    if not service_account:
+        # No invoker identity configured: nothing to check against, so refuse
+        return False
+    auth_header = request.headers.get("Authorization", "")
+    if not auth_header.startswith("Bearer "):
+        return False
+    try:
+        claims = id_token.verify_oauth2_token(
+            auth_header[7:], _auth_request, audience=audience
+        )
+    except ValueError:
+        return False
+    return claims.get("email_verified") is True and claims.get("email") == service_account
+
+def _publish_queue_enabled():
+    return bool(tasks_v2 and PUBLISH_TASKS_QUEUE and PUBLISH_WORKER_URL)
+
+def _enqueue_publish(payload):
+    """Create a Cloud Task that POSTs the payload to /publish/worker."""
+    global _tasks_client
+    if _tasks_client is None:
+        _tasks_client = tasks_v2.CloudTasksClient()
+    
+    http_request = {
+        "http_method": tasks_v2.HttpMethod.POST,
+        "url": PUBLISH_WORKER_URL,
+        "headers": {"Content-Type": "application/json"},
+        "body": json.dumps(payload).encode(),
+    }
+    if PUBLISH_TASKS_SERVICE_ACCOUNT:
+        http_request["oidc_token"] = {
+            "service_account_email": PUBLISH_TASKS_SERVICE_ACCOUNT,
+            "audience": PUBLISH_WORKER_URL
+        }
+    
+    _tasks_client.create_task(parent=PUBLISH_TASKS_QUEUE, task={"http_request": http_request})
+
 @app.route('/publish_random', methods=['GET', 'POST'])
 def publish_random_reel():
     """
@@ -107,25 +292,21 @@ def publish_random_reel():
     """
     import random
     try:
-        firestore = FirestoreService()
-        gcs = GCSService()
-        instagram = InstagramService()
+        firestore = get_firestore_service()
+        instagram = get_instagram_service()
 
-        # 1. Get all characters
-        characters = firestore.get_all_characters()
-        
-        # 2. Filter for those with original remix
-        eligible_posts = []
-        for char in characters:
-            for asset in char.get("assets", []):
-                if asset.get("remix_orig_watermarked"):
-                    eligible_posts.append({
-                        "character_id": char["id"],
-                        "name": char["name"],
-                        "anime": char["anime"],
-                        "asset_title": asset["title"],
-                        "gcs_uri": asset["remix_orig_watermarked"]
-                    })
+        # 1-2. Probe for one random flagged character (single doc read); if that
+        #      finds nothing, collect original remix assets from all flagged
+        #      characters as the stream arrives, then fall back to a full scan
+        #      for docs written before the flag existed
+        sampled = firestore.sample_eligible_reel()
+        eligible_posts = _collect_orig_remixes([sampled] if sampled else [])
+        if not eligible_posts:
+            eligible_posts = _collect_orig_remixes(firestore.iter_eligible_reels())
+        if not eligible_posts:
+            eligible_posts = _collect_orig_remixes(
+                firestore.get_all_characters_parallel(fields=["id", "name", "anime", "assets"])
+            )
         
         if not eligible_posts:
             return jsonify({"error": "No characters found with remix_orig_watermarked"}), 404
@@ -139,7 +320,7 @@ def publish_random_reel():
         gcs_uri = post["gcs_uri"]
         
         # 4. Generate signed URL
-        video_url = gcs.get_signed_url(gcs_uri, expiration_hours=1)
+        video_url = _get_signed_url(gcs_uri)
         
         # 5. Prepare caption
         caption = f"{post['name']} from {post['anime']}! Remix 💙 #anime #dance #cosplay"
@@ -149,7 +330,7 @@ def publish_random_reel():
         result = instagram.publish_reel(video_url=video_url, caption=caption)
 
         if result.get("success"):
-            firestore.save_instagram_post(
+            _save_post_async(
                 char_id=char_id,
                 asset_title=asset_title,
                 media_url=gcs_uri,
@@ -169,6 +350,47 @@ def publish_random_reel():
         logger.error(f"Error in random publish: {e}")
         return jsonify({"error": str(e)}), 500
 
+def _collect_orig_remixes(characters):
+    """Publishable (character, asset) pairs that have an original-soundtrack remix."""
+    eligible_posts = []
+    for char in characters:
+        for asset in char.get("assets", []):
+            if asset.get("remix_orig_watermarked"):
+                eligible_posts.append({
+                    "character_id": char["id"],
+                    "name": char["name"],
+                    "anime": char["anime"],
+                    "asset_title": asset["title"],
+                    "gcs_uri": asset["remix_orig_watermarked"]
+                })
+    return eligible_posts
+
+@app.route('/rerandomize', methods=['POST'])
+def rerandomize():
+    """Cloud Scheduler target: re-draw the random probe key used by /publish_random."""
+    if not (SCHEDULER_SERVICE_ACCOUNT and RERANDOMIZE_URL):
+        return jsonify({"error": "SCHEDULER_SERVICE_ACCOUNT and RERANDOMIZE_URL must be set"}), 503
+    if not _verify_oidc_token(SCHEDULER_SERVICE_ACCOUNT, RERANDOMIZE_URL):
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    try:
+        updated = get_firestore_service().rerandomize_reel_probes()
+        return jsonify({"updated": updated}), 200
+    except Exception as e:
+        logger.error(f"Error re-randomizing: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/warmup', methods=['GET'])
+def warmup():
+    """
+    Create the Firestore/GCS clients (and import their SDKs) ahead of the first
+    real request. Services are otherwise built lazily on first use and then
+    reused. Instagram is skipped: it raises without INSTAGRAM_USER_TOKEN.
+    """
+    get_firestore_service()
+    get_gcs_service()
+    return jsonify({"status": "warm"}), 200
+
 @app.route('/health', methods=['GET'])
 def health():
     return jsonify({"status": "healthy"}), 200
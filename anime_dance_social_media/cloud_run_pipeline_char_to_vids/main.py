@@ -6,7 +6,10 @@ import os
 import sys
 import json
 import uuid
+import random
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from functools import wraps
 
@@ -14,12 +17,29 @@ from functools import wraps
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Flask imports only
-from flask import Flask, request, jsonify, g
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from flask import Flask, request, jsonify
+from google.cloud import firestore, storage
+from google.auth.transport import requests as google_requests
+from google.oauth2 import id_token
+
+try:
+    from google.cloud import tasks_v2
+except ImportError:
+    tasks_v2 = None
 
 # Add parent path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+# Pipeline modules are imported at load time (not per job) so the first job
+# after a cold start doesn't pay the import cost
+from workflows.character_gen import generate_new_targets_list, generate_characters
+from workflows.main_pipeline import run_end_to_end_pipeline, ensure_cosplay_version
+from utils.db_utils import get_entry, iter_db, DB_FILE
+from services.gemini_service import GeminiService
+
 app = Flask(__name__)
 
 # Configuration from environment
@@ -31,21 +51,51 @@ API_KEY = os.getenv('PIPELINE_API_KEY', 'dev-key')
 JOBS_COLLECTION = 'pipeline_jobs'
 CHARACTERS_COLLECTION = 'characters'
 
+# Cloud Tasks queue (projects/<p>/locations/<l>/queues/<q>) that delivers jobs to
+# this service's /internal/process/<job_id>. Unset = run jobs on a local thread.
+PIPELINE_TASKS_QUEUE = os.getenv('PIPELINE_TASKS_QUEUE')
+PIPELINE_SERVICE_URL = os.getenv('PIPELINE_SERVICE_URL', '').rstrip('/')
+PIPELINE_TASKS_SERVICE_ACCOUNT = os.getenv('PIPELINE_TASKS_SERVICE_ACCOUNT')
+_tasks_client = None
+
+# A task must finish within its 30 min dispatch deadline and a character takes
+# ~20 min, so each task processes this many characters and re-queues the job
+# for the rest
+TASK_DISPATCH_DEADLINE = 1800
+CHARACTERS_PER_TASK = 1
+
+# A running job whose claim is older than this is presumed dead (instance
+# lost mid-task) and can be claimed again by the redelivered task
+CLAIM_LEASE_SECONDS = TASK_DISPATCH_DEADLINE
+
+# Reused for OIDC verification (fetching Google's certs) across requests
+_auth_request = google_requests.Request()
+
+
+# Clients are shared by all requests and background jobs (both are thread-safe)
+_FS_CLIENT = firestore.Client(project=PROJECT_ID)
+_GCS_CLIENT = storage.Client(project=PROJECT_ID)
+
+
+# Pooled keep-alive session for outbound webhook calls
+_HTTP = requests.Session()
+_HTTP_ADAPTER = HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=32,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+)
+_HTTP.mount('https://', _HTTP_ADAPTER)
+_HTTP.mount('http://', _HTTP_ADAPTER)
+
 
 def get_firestore():
-    """Lazy load Firestore client"""
-    if not hasattr(g, 'firestore'):
-        from google.cloud import firestore
-        g.firestore = firestore.Client(project=PROJECT_ID)
-    return g.firestore
+    """Shared Firestore client"""
+    return _FS_CLIENT
 
 
 def get_gcs():
-    """Lazy load GCS client"""
-    if not hasattr(g, 'gcs'):
-        from google.cloud import storage
-        g.gcs = storage.Client(project=PROJECT_ID)
-    return g.gcs
+    """Shared GCS client"""
+    return _GCS_CLIENT
 
 
 def require_api_key(f):
@@ -88,6 +138,13 @@ def health():
     })
 
 
+@app.route('/_ah/warmup')
+def warmup():
+    """Open the Firestore gRPC channel before the first real request"""
+    get_firestore().collection(JOBS_COLLECTION).limit(1).get()
+    return jsonify({'status': 'warm'})
+
+
 # ============== PIPELINE API ==============
 
 @app.route('/pipeline/run', methods=['POST'])
@@ -99,7 +156,8 @@ def run_pipeline():
     Body: {
         "count": 1,
         "style_id": "kpop_dance",
-        "webhook_url": "optional"
+        "webhook_url": "optional",
+        "idempotency_key": "optional (or Idempotency-Key header)"
     }
     """
     try:
@@ -110,8 +168,12 @@ def run_pipeline():
         if not isinstance(count, int) or count < 1 or count > 10:
             return jsonify({'error': 'Invalid count (1-10)'}), 400
         
-        # Create job record
-        job_id = str(uuid.uuid4())
+        # Retries carrying the same Idempotency-Key map to the same job doc
+        idempotency_key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+        if idempotency_key:
+            job_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f'{JOBS_COLLECTION}/{idempotency_key}'))
+        else:
+            job_id = str(uuid.uuid4())
         db = get_firestore()
         
         job_doc = {
@@ -134,13 +196,21 @@ def run_pipeline():
             'updated_at': datetime.utcnow().isoformat()
         }
         
-        db.collection(JOBS_COLLECTION).document(job_id).set(job_doc)
+        stored, created = _create_job(db.transaction(), db.collection(JOBS_COLLECTION).document(job_id), job_doc)
+        if not created:
+            # Duplicate request. A job still queued may have lost its task (the
+            # original request failed after the commit), so dispatch it again;
+            # _claim_job keeps a second delivery from running it twice
+            if stored.get('status') == 'queued':
+                _dispatch_job(job_id)
+            return jsonify({
+                'success': True,
+                'job_id': job_id,
+                'status': stored.get('status'),
+                'message': 'Job already exists for this idempotency key'
+            }), 200
         
-        # Trigger processing (in background thread for Cloud Run)
-        import threading
-        thread = threading.Thread(target=_process_job, args=(job_id, job_doc['config']))
-        thread.daemon = True
-        thread.start()
+        _dispatch_job(job_id)
         
         logger.info(f"Job {job_id} started")
         
@@ -157,6 +227,19 @@ def run_pipeline():
         return jsonify({'error': str(e)}), 500
 
 
+@firestore.transactional
+def _create_job(transaction, job_ref, job_doc: dict):
+    """
+    Create the job doc unless it already exists, in one transaction.
+    Returns (doc, created); an existing doc is returned untouched.
+    """
+    snapshot = job_ref.get(transaction=transaction)
+    if snapshot.exists:
+        return snapshot.to_dict(), False
+    transaction.create(job_ref, job_doc)
+    return job_doc, True
+
+
 @app.route('/pipeline/status/<job_id>')
 @require_api_key
 def get_status(job_id):
@@ -174,6 +257,10 @@ def get_status(job_id):
         return jsonify({'error': str(e)}), 500
 
 
+# Fields returned by /pipeline/jobs
+LIST_FIELDS = ['job_id', 'status', 'created_at', 'updated_at', 'progress']
+
+
 @app.route('/pipeline/jobs')
 @require_api_key
 def list_jobs():
@@ -183,11 +270,14 @@ def list_jobs():
         status_filter = request.args.get('status')
         limit = int(request.args.get('limit', 10))
         
-        query = db.collection(JOBS_COLLECTION).order_by('created_at', direction='DESCENDING').limit(limit)
+        # Listing only needs the summary fields, not the results/errors arrays
+        query = db.collection(JOBS_COLLECTION).select(LIST_FIELDS)
         
         if status_filter:
             query = query.where('status', '==', status_filter)
         
+        query = query.order_by('created_at', direction='DESCENDING').limit(limit)
+        
         jobs = [doc.to_dict() for doc in query.stream()]
         
         return jsonify({
@@ -224,155 +314,423 @@ def cancel_job(job_id):
 
 # ============== BACKGROUND PROCESSING ==============
 
-def _process_job(job_id: str, config: dict):
+def _tasks_enabled() -> bool:
+    return bool(tasks_v2 and PIPELINE_TASKS_QUEUE and PIPELINE_SERVICE_URL)
+
+
+def _dispatch_job(job_id: str):
+    """
+    Hand a queued job to a worker request via Cloud Tasks; without a queue,
+    fall back to a background thread in this instance
+    """
+    if _tasks_enabled():
+        _enqueue_job(job_id)
+    else:
+        thread = threading.Thread(target=_run_queued_job, args=(job_id,))
+        thread.daemon = True
+        thread.start()
+
+
+def _run_queued_job(job_id: str):
+    """Background-thread worker: claim the job, then process it"""
+    job, claimed = _claim_job(job_id)
+    if claimed:
+        _process_job(job_id, job['config'], claim=job['worker_claim'])
+
+
+def _claim_job(job_id: str):
+    """
+    Move the job from queued to running under a fresh worker_claim token,
+    or take over a running job whose claim lease has expired.
+    Returns (doc, claimed); doc is None if the job doesn't exist. A claimed
+    doc carries the new token, which the worker checks before writing.
+    """
+    db = get_firestore()
+    return _claim_job_txn(db.transaction(), db.collection(JOBS_COLLECTION).document(job_id))
+
+
+@firestore.transactional
+def _claim_job_txn(transaction, job_ref):
+    snapshot = job_ref.get(transaction=transaction)
+    if not snapshot.exists:
+        return None, False
+    job = snapshot.to_dict()
+    if job.get('status') != 'queued' and not _claim_expired(job):
+        return job, False
+    now = datetime.utcnow().isoformat()
+    job['worker_claim'] = uuid.uuid4().hex
+    transaction.update(job_ref, {
+        'status': 'running',
+        # Token of the worker that owns this job, and when it took it
+        'worker_claim': job['worker_claim'],
+        'claimed_at': now,
+        'updated_at': now
+    })
+    return job, True
+
+
+def _claim_expired(job: dict) -> bool:
+    """True for a running job whose worker hasn't been heard from within the lease"""
+    if job.get('status') != 'running' or not job.get('claimed_at'):
+        return False
+    claimed_at = datetime.fromisoformat(job['claimed_at'])
+    return (datetime.utcnow() - claimed_at).total_seconds() > CLAIM_LEASE_SECONDS
+
+
+def _requeue_job(job_id: str, claim: str) -> bool:
+    """
+    Put a running job back in the queue, if `claim` still owns it.
+    Returns False when another worker has taken the job over.
+    """
+    db = get_firestore()
+    return _requeue_job_txn(db.transaction(), db.collection(JOBS_COLLECTION).document(job_id), claim)
+
+
+@firestore.transactional
+def _requeue_job_txn(transaction, job_ref, claim: str) -> bool:
+    snapshot = job_ref.get(transaction=transaction)
+    if not snapshot.exists or snapshot.get('worker_claim') != claim:
+        return False
+    if snapshot.get('status') != 'running':
+        # Cancelled while this task ran
+        return False
+    transaction.update(job_ref, {
+        'status': 'queued',
+        'updated_at': datetime.utcnow().isoformat()
+    })
+    return True
+
+
+def _enqueue_job(job_id: str):
+    """Create a Cloud Task that POSTs to /internal/process/<job_id>"""
+    global _tasks_client
+    if _tasks_client is None:
+        _tasks_client = tasks_v2.CloudTasksClient()
+    
+    http_request = {
+        'http_method': tasks_v2.HttpMethod.POST,
+        'url': f'{PIPELINE_SERVICE_URL}/internal/process/{job_id}',
+    }
+    if PIPELINE_TASKS_SERVICE_ACCOUNT:
+        http_request['oidc_token'] = {
+            'service_account_email': PIPELINE_TASKS_SERVICE_ACCOUNT,
+            'audience': PIPELINE_SERVICE_URL
+        }
+    
+    _tasks_client.create_task(parent=PIPELINE_TASKS_QUEUE, task={
+        'http_request': http_request,
+        # Cloud Tasks' maximum; CHARACTERS_PER_TASK of the job run inside this request
+        'dispatch_deadline': {'seconds': TASK_DISPATCH_DEADLINE}
+    })
+
+
+def _verify_task_token() -> bool:
+    """Check the OIDC token Cloud Tasks attaches to /internal requests"""
+    if not PIPELINE_TASKS_SERVICE_ACCOUNT:
+        # The service is deployed unauthenticated, so without an invoker
+        # identity there is nothing to check against: refuse
+        return False
+    auth_header = request.headers.get('Authorization', '')
+    if not auth_header.startswith('Bearer '):
+        return False
+    try:
+        claims = id_token.verify_oauth2_token(
+            auth_header[7:], _auth_request, audience=PIPELINE_SERVICE_URL
+        )
+    except ValueError:
+        return False
+    return (
+        claims.get('email_verified') is True
+        and claims.get('email') == PIPELINE_TASKS_SERVICE_ACCOUNT
+    )
+
+
+@app.route('/internal/process/<job_id>', methods=['POST'])
+def process_job_task(job_id):
+    """
+    Cloud Tasks target: run one queued job inside this request.
+    Returns 2xx for anything a retry can't fix, so the task isn't redelivered.
+    """
+    if not _verify_task_token():
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    job, claimed = _claim_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    if not claimed:
+        if job.get('status') == 'running':
+            # Another worker holds a live claim; retry once its lease may have run out
+            return jsonify({'job_id': job_id, 'status': 'running', 'retry': True}), 409
+        # Redelivered task for a finished or cancelled job
+        return jsonify({'job_id': job_id, 'status': job.get('status'), 'skipped': True})
+    
+    _process_job(
+        job_id, job['config'],
+        done=job.get('progress', {}).get('completed', 0),
+        limit=CHARACTERS_PER_TASK,
+        claim=job['worker_claim']
+    )
+    return jsonify({'job_id': job_id, 'status': 'processed'})
+
+
+class FirestoreWriteCoalescer:
+    """
+    Collects updates for one document and writes them in a single update()
+    on flush() or when the with-block exits. Results/errors are appended with
+    ArrayUnion, counters with Increment.
+    
+    Don't stage a map field and one of its dotted sub-fields in the same flush
+    (Firestore rejects overlapping paths in one update). With `owned` given,
+    flush() drops the staged writes once it returns False.
+    """
+    
+    def __init__(self, ref, owned=None):
+        self.ref = ref
+        self.owned = owned
+        self._reset()
+    
+    def _reset(self):
+        self.fields = {}
+        self.increments = {}
+        self.results = []
+        self.errors = []
+    
+    def set(self, key: str, value):
+        self.fields[key] = value
+    
+    def increment(self, key: str, delta: int = 1):
+        self.increments[key] = self.increments.get(key, 0) + delta
+    
+    def add_result(self, result: dict):
+        self.results.append(result)
+    
+    def add_error(self, error: str):
+        self.errors.append({
+            'message': error,
+            'time': datetime.utcnow().isoformat()
+        })
+    
+    def flush(self):
+        """Write everything staged so far (no-op if nothing is staged)"""
+        payload = dict(self.fields)
+        for key, delta in self.increments.items():
+            payload[key] = firestore.Increment(delta)
+        if self.results:
+            payload['results'] = firestore.ArrayUnion(self.results)
+        if self.errors:
+            payload['errors'] = firestore.ArrayUnion(self.errors)
+        if not payload:
+            return
+        if self.owned is not None and not self.owned():
+            self._reset()
+            return
+        payload['updated_at'] = datetime.utcnow().isoformat()
+        self.ref.update(payload)
+        self._reset()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+        return False
+
+
+def _process_job(job_id: str, config: dict, done: int = 0, limit: int = None, claim: str = None):
     """
     Process pipeline job in background
-    Heavy imports done here to keep startup fast
+    
+    Args:
+        done: Characters already processed by earlier tasks of this job
+        limit: Process at most this many characters, then put the job back
+               in the queue for the rest (None = all of them)
+        claim: worker_claim token from _claim_job; once the doc carries a
+               different one, this worker stops and writes nothing more
     """
     logger.info(f"Processing job {job_id}")
     
-    # Heavy imports only when processing
+    watch = None
+    claim_lost = threading.Event()
     try:
-        from workflows.character_gen import generate_characters
-        from workflows.main_pipeline import run_end_to_end_pipeline
-        from utils.db_utils import get_entry
-        import random
-        import glob
-        
         db = get_firestore()
+        job_ref = db.collection(JOBS_COLLECTION).document(job_id)
         
-        def update_status(status: str, progress: dict = None):
-            updates = {
-                'status': status,
-                'updated_at': datetime.utcnow().isoformat()
-            }
-            if progress:
-                updates['progress'] = progress
-            db.collection(JOBS_COLLECTION).document(job_id).update(updates)
-        
-        def add_result(result: dict):
-            db.collection(JOBS_COLLECTION).document(job_id).update({
-                'results': firestore.ArrayUnion([result]),
-                'updated_at': datetime.utcnow().isoformat()
-            })
+        # Cancellation (or another worker taking the job over) arrives via a
+        # snapshot listener instead of a read per character
+        cancel_event = threading.Event()
         
-        def add_error(error: str):
-            db.collection(JOBS_COLLECTION).document(job_id).update({
-                'errors': firestore.ArrayUnion([{
-                    'message': error,
-                    'time': datetime.utcnow().isoformat()
-                }]),
-                'updated_at': datetime.utcnow().isoformat()
-            })
+        def _on_snapshot(docs, changes, read_time):
+            for d in docs:
+                if not d.exists:
+                    continue
+                data = d.to_dict()
+                if claim and data.get('worker_claim') != claim:
+                    claim_lost.set()
+                    cancel_event.set()
+                if data.get('status') == 'cancelled':
+                    cancel_event.set()
         
-        # Update to running
-        update_status('running', {'total': config['count'], 'completed': 0})
+        watch = job_ref.on_snapshot(_on_snapshot)
         
         count = config['count']
         style_id = config['style_id']
-        
-        # Load reference videos from GCS or local temp
-        ref_videos = _get_reference_videos()
-        
-        if not ref_videos:
-            raise ValueError("No reference videos available")
-        
-        # Generate characters
-        logger.info(f"Generating {count} characters...")
-        
-        # Use workflow to brainstorm and generate
-        from services.gemini_service import GeminiService
-        
-        service = GeminiService()
-        from workflows.character_gen import generate_new_targets_list, generate_characters
-        
-        # Get existing names
-        from utils.db_utils import load_db
-        existing_names = {e.get('name') for e in load_db()}
-        
-        # Brainstorm targets
-        targets = generate_new_targets_list(service, existing_names, count)
-        
-        for i, (name, anime) in enumerate(targets):
-            # Check if cancelled
-            doc = db.collection(JOBS_COLLECTION).document(job_id).get()
-            if doc.to_dict().get('status') == 'cancelled':
-                logger.info(f"Job {job_id} cancelled")
-                return
+        batch = count - done if limit is None else min(limit, count - done)
+        
+        # Job doc writes are coalesced: a character's result/error/progress
+        # goes out together with the next stage change (~2 updates per character)
+        with FirestoreWriteCoalescer(job_ref, owned=lambda: not claim_lost.is_set()) as writes:
+            # Update to running
+            writes.set('status', 'running')
+            if done == 0:
+                writes.set('progress', {'total': count, 'completed': 0})
+            writes.flush()
             
-            logger.info(f"Processing character {i+1}/{len(targets)}: {name}")
-            update_status('running', {
-                'total': count,
-                'completed': i,
-                'current': name,
-                'stage': 'character_generation'
-            })
+            # Load reference videos from GCS or local temp
+            ref_videos = _get_reference_videos()
             
-            # Generate character
-            char_ids = generate_characters(target_list=[(name, anime)])
+            if not ref_videos:
+                raise ValueError("No reference videos available")
             
-            if not char_ids:
-                add_error(f"Failed to generate character: {name}")
-                continue
+            # Generate characters
+            logger.info(f"Generating {batch} of {count} characters...")
             
-            char_id = char_ids[0]
-            entry = get_entry(char_id)
+            # Use workflow to brainstorm and generate
+            service = GeminiService()
             
-            if not entry:
-                add_error(f"Entry not found: {char_id}")
-                continue
+            # Get existing names
+            existing_names = _existing_names()
             
-            # Get character image
-            primary = next((a for a in entry.get('assets', []) if a.get('title') == 'primary'), None)
-            char_img = primary.get('anime_image') if primary else None
+            # Brainstorm targets
+            targets = generate_new_targets_list(service, existing_names, batch)[:batch]
             
-            if not char_img or not os.path.exists(char_img):
-                add_error(f"Character image not found: {char_id}")
-                continue
+            # Count targets brainstorming couldn't supply as done-with-error, so
+            # the job still moves forward instead of re-queuing the same batch
+            missed = batch - len(targets)
+            if missed:
+                writes.add_error(f"Brainstorming returned {len(targets)} of {batch} targets")
+                writes.increment('progress.completed', missed)
             
-            # Generate 3 dance versions with different refs
-            dances = []
-            for j in range(min(3, len(ref_videos))):
-                ref = random.choice(ref_videos)
+            for i, (name, anime) in enumerate(targets):
+                # Check if cancelled
+                if cancel_event.is_set():
+                    logger.info(f"Job {job_id} cancelled")
+                    return
                 
-                update_status('running', {
-                    'total': count,
-                    'completed': i,
-                    'current': name,
-                    'stage': f'dance_generation_v{j+1}'
-                })
+                logger.info(f"Processing character {done+i+1}/{count}: {name}")
+                writes.set('progress.stage', 'character_generation')
+                writes.set('progress.current', name)
+                writes.flush()
                 
+                # Generate character
+                char_ids = generate_characters(target_list=[(name, anime)])
+                
+                if not char_ids:
+                    writes.add_error(f"Failed to generate character: {name}")
+                    writes.increment('progress.completed')
+                    continue
+                
+                char_id = char_ids[0]
+                entry = get_entry(char_id)
+                
+                if not entry:
+                    writes.add_error(f"Entry not found: {char_id}")
+                    writes.increment('progress.completed')
+                    continue
+                
+                # Get character image
+                primary = next((a for a in entry.get('assets', []) if a.get('title') == 'primary'), None)
+                char_img = primary.get('anime_image') if primary else None
+                
+                if not char_img or not os.path.exists(char_img):
+                    writes.add_error(f"Character image not found: {char_id}")
+                    writes.increment('progress.completed')
+                    continue
+                
+                if cancel_event.is_set():
+                    logger.info(f"Job {job_id} cancelled")
+                    return
+                
+                # Generate 3 dance versions with different refs, all at once
+                # (each is a long, network-bound FAL/Kling round-trip)
+                num_versions = min(3, len(ref_videos))
+                writes.set('progress.stage', f'dance_generation_x{num_versions}')
+                writes.flush()
+                
+                # Distinct refs, so no two versions repeat the same Kling job
+                refs = random.sample(ref_videos, k=num_versions)
+                
+                # The versions share one cosplay image: create it once here
+                # rather than letting the workers race to write the same file
                 try:
-                    deliverable = run_end_to_end_pipeline(
-                        char_img=char_img,
-                        ref_video=ref,
-                        char_id=char_id,
-                        reuse_cosplay=True,
-                        style_id=style_id
-                    )
-                    
-                    if deliverable:
-                        dances.append({
-                            'version': j+1,
-                            'ref': os.path.basename(ref),
-                            'deliverable': deliverable
-                        })
-                        
+                    dance_img = ensure_cosplay_version(char_img, char_id, reuse_cosplay=True)
                 except Exception as e:
-                    logger.error(f"Dance generation failed: {e}")
-                    add_error(f"Dance v{j+1} failed for {name}: {e}")
+                    logger.error(f"Cosplay preparation failed: {e}")
+                    writes.add_error(f"Cosplay preparation failed for {name}: {e}")
+                    writes.increment('progress.completed')
+                    continue
+                
+                dances = []
+                with ThreadPoolExecutor(max_workers=num_versions) as pool:
+                    futures = {}
+                    for j, ref in enumerate(refs):
+                        future = pool.submit(
+                            run_end_to_end_pipeline,
+                            char_img=dance_img,
+                            ref_video=ref,
+                            char_id=char_id,
+                            style_id=style_id,
+                            prepare_cosplay=False
+                        )
+                        futures[future] = (j, ref)
+                    
+                    # Staged writes stay on this thread
+                    for future in as_completed(futures):
+                        j, ref = futures[future]
+                        try:
+                            deliverable = future.result()
+                            
+                            if deliverable:
+                                dances.append({
+                                    'version': j+1,
+                                    'ref': os.path.basename(ref),
+                                    'deliverable': deliverable
+                                })
+                                
+                        except Exception as e:
+                            logger.error(f"Dance generation failed: {e}")
+                            writes.add_error(f"Dance v{j+1} failed for {name}: {e}")
+                dances.sort(key=lambda d: d['version'])
+                
+                # Add result
+                writes.add_result({
+                    'character_id': char_id,
+                    'name': name,
+                    'anime': anime,
+                    'dances_generated': len(dances),
+                    'status': 'completed' if dances else 'partial'
+                })
+                writes.increment('progress.completed')
             
-            # Add result
-            add_result({
-                'character_id': char_id,
-                'name': name,
-                'anime': anime,
-                'dances_generated': len(dances),
-                'status': 'completed' if dances else 'partial'
-            })
-        
-        # Mark complete
-        update_status('completed', {'total': count, 'completed': count})
+            completed = done + missed + len(targets)
+            if completed < count:
+                if cancel_event.is_set():
+                    logger.info(f"Job {job_id} cancelled")
+                    return
+                # Back in the queue; the next task claims it and continues
+                writes.flush()
+                if claim is None:
+                    writes.set('status', 'queued')
+                    writes.flush()
+                elif not _requeue_job(job_id, claim):
+                    logger.info(f"Job {job_id} taken over or cancelled; not re-queued")
+                    return
+                _enqueue_job(job_id)
+                logger.info(f"Job {job_id}: {completed}/{count} done, re-queued")
+                return
+            
+            # Mark complete (written with the last character's result on exit)
+            writes.set('status', 'completed')
         
         # Call webhook if provided
         if config.get('webhook_url'):
@@ -386,6 +744,9 @@ def _process_job(job_id: str, config: dict):
         
     except Exception as e:
         logger.error(f"Job {job_id} failed: {e}")
+        if claim_lost.is_set():
+            # The job belongs to another worker now
+            return
         try:
             db = get_firestore()
             db.collection(JOBS_COLLECTION).document(job_id).update({
@@ -395,31 +756,65 @@ def _process_job(job_id: str, config: dict):
             })
         except:
             pass
+    finally:
+        if watch is not None:
+            watch.unsubscribe()
+
+
+# dir -> (st_mtime_ns, [video paths]); rescanned only when the dir changes
+_REF_VIDEO_CACHE = {}
+
+
+def _scan_videos(directory: str) -> list:
+    """.mp4 files in directory (cached until its mtime changes)"""
+    try:
+        mtime = os.stat(directory).st_mtime_ns
+    except OSError:
+        return []
+    
+    cached = _REF_VIDEO_CACHE.get(directory)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    
+    with os.scandir(directory) as it:
+        vids = [e.path for e in it if e.name.endswith('.mp4') and e.is_file()]
+    _REF_VIDEO_CACHE[directory] = (mtime, vids)
+    return vids
+
+
+# (DB st_mtime_ns, frozenset of names); rebuilt only when the DB file changes
+_NAMES_CACHE = (None, frozenset())
+
+
+def _existing_names() -> frozenset:
+    """Names of all characters in the local DB (cached until the file changes)"""
+    global _NAMES_CACHE
+    try:
+        mtime = os.stat(DB_FILE).st_mtime_ns
+    except OSError:
+        return frozenset()
+    
+    if _NAMES_CACHE[0] != mtime:
+        _NAMES_CACHE = (mtime, frozenset(e.get('name') for e in iter_db()))
+    return _NAMES_CACHE[1]
 
 
 def _get_reference_videos():
     """Get reference videos from temp directory or GCS"""
     # Local temp directory
-    temp_dir = '/tmp/references'
-    if os.path.exists(temp_dir):
-        vids = [os.path.join(temp_dir, f) for f in os.listdir(temp_dir) if f.endswith('.mp4')]
-        if vids:
-            return vids
+    vids = _scan_videos('/tmp/references')
+    if vids:
+        return vids
     
     # Fallback to project temp
-    import glob
     fallback = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'temp_process_kling')
-    if os.path.exists(fallback):
-        return glob.glob(os.path.join(fallback, '*.mp4'))
-    
-    return []
+    return _scan_videos(fallback)
 
 
 def _call_webhook(url: str, payload: dict):
     """Call webhook URL"""
     try:
-        import requests
-        requests.post(url, json=payload, timeout=30)
+        _HTTP.post(url, json=payload, timeout=30)
     except Exception as e:
         logger.error(f"Webhook failed: {e}")
 
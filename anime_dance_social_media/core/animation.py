@@ -1,10 +1,9 @@
 import os
 import sys
-import fal_client
-import requests
-import time
-import shutil
-import traceback
+import functools
+import pathlib
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
 # Add current dir to path
 # Add project root to path
@@ -18,30 +17,194 @@ except ImportError:
     # If run as module, this might fail, but sys.path fixes it for scripts
     from services.gemini_service import GeminiService
 
-# Try imports
+# OpenCV is optional: used for frame grabs / duration when ffmpeg isn't on PATH
 try:
-    from moviepy.video.io.VideoFileClip import VideoFileClip
+    import cv2
 except ImportError:
-    try:
-        from moviepy.editor import VideoFileClip
-    except ImportError:
-        print("❌ MoviePy not found. Please install it: pip install moviepy")
-        sys.exit(1)
+    cv2 = None
+
+@functools.lru_cache(maxsize=1)
+def _gemini():
+    """Shared GeminiService (it only holds keys + a rotation index; clients are per call)"""
+    return GeminiService()
 
 # Temp dir for operations
 TEMP_TRIM_DIR = os.path.join(ROOT, "output", "temp")
 
+# fal_client and requests are imported on first use, so importing this module
+# (e.g. from a web service's startup path) doesn't load them
+@functools.lru_cache(maxsize=1)
+def _fal():
+    import fal_client
+    return fal_client
+
+@functools.lru_cache(maxsize=1)
+def _http():
+    """Shared keep-alive session for result downloads (one pool slot per parallel job)"""
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=16,
+        pool_maxsize=32,
+        max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def _video_file_clip():
+    """MoviePy VideoFileClip, imported only when ffmpeg and OpenCV are unavailable"""
+    try:
+        from moviepy.video.io.VideoFileClip import VideoFileClip
+    except ImportError:
+        from moviepy.editor import VideoFileClip
+    return VideoFileClip
+
+def _ffprobe_duration(path):
+    """Container duration in seconds via ffprobe (None if it can't be read)"""
+    try:
+        proc = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+            capture_output=True, text=True, check=True
+        )
+        return float(proc.stdout.strip())
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        return None
+
+def _cv2_duration(path):
+    """Duration from OpenCV's frame count / fps (None if unavailable)"""
+    if cv2 is None:
+        return None
+    cap = cv2.VideoCapture(path)
+    try:
+        frames = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        fps = cap.get(cv2.CAP_PROP_FPS)
+    finally:
+        cap.release()
+    return frames / fps if frames > 0 and fps > 0 else None
+
+def _video_duration(path):
+    duration = _ffprobe_duration(path)
+    if duration is None:
+        duration = _cv2_duration(path)
+    if duration is not None:
+        return duration
+    clip = _video_file_clip()(path)
+    try:
+        return clip.duration
+    finally:
+        clip.close()
+
+def _extract_first_frame(video_path, frame_path):
+    """Writes frame 0 of video_path to frame_path (ffmpeg, then OpenCV, then MoviePy)"""
+    try:
+        subprocess.run(
+            ["ffmpeg", "-y", "-v", "error", "-ss", "0", "-i", video_path,
+             "-frames:v", "1", "-q:v", "2", frame_path],
+            capture_output=True, check=True
+        )
+        return
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"      ⚠️ ffmpeg frame grab failed ({e}), falling back")
+    
+    if cv2 is not None:
+        cap = cv2.VideoCapture(video_path)
+        try:
+            ok, frame = cap.read()
+        finally:
+            cap.release()
+        if ok and cv2.imwrite(frame_path, frame):
+            return
+    
+    clip = _video_file_clip()(video_path)
+    try:
+        clip.save_frame(frame_path, t=0)
+    finally:
+        clip.close()
+
+def _trim_video(src, dst, max_duration):
+    """
+    Writes the first max_duration seconds of src to dst.
+    Tries a stream copy first (no re-encode); re-encodes only if the copy
+    fails or doesn't produce a playable file.
+    """
+    base = ["ffmpeg", "-y", "-v", "error", "-ss", "0", "-t", str(max_duration), "-i", src]
+    attempts = (
+        ["-c", "copy"],
+        ["-c:v", "libx264", "-preset", "ultrafast", "-c:a", "aac"],
+    )
+    for codec_args in attempts:
+        try:
+            subprocess.run(base + codec_args + [dst], capture_output=True, check=True)
+        except (OSError, subprocess.CalledProcessError):
+            continue
+        if (_ffprobe_duration(dst) or 0) > 0:
+            return
+    
+    print("   ⚠️ ffmpeg trim failed, falling back to MoviePy")
+    clip = _video_file_clip()(src)
+    try:
+        sub = clip.subclipped(0, max_duration)
+        sub.write_videofile(dst, codec="libx264", audio_codec="aac", logger=None)
+        sub.close()
+    finally:
+        clip.close()
+
+@functools.lru_cache(maxsize=1)
 def load_fal_key():
     key = os.environ.get("FAL_AI_KEY")
     if key: return key
     env_path = os.path.join(ROOT, "..", ".env")
     if os.path.exists(env_path):
-        with open(env_path, "r") as f:
-            for line in f:
-                if line.strip().startswith("FAL_AI_KEY="):
-                    return line.strip().split("=", 1)[1].strip().strip('"')
+        for line in pathlib.Path(env_path).read_text().splitlines():
+            name, sep, value = line.strip().partition("=")
+            if sep and name == "FAL_AI_KEY":
+                return value.strip().strip('"')
     return None
 
+# fal_client reads FAL_KEY from the environment; set it once per process
+if load_fal_key():
+    os.environ["FAL_KEY"] = load_fal_key()
+
+# swap_first_frame prompt pieces (built once; indexed by is_cosplay)
+_STYLE_COSPLAY = (
+    "PHOTOREALISTIC 1990s COSPLAY PHOTO. "
+    "The subject must look like a REAL HUMAN in a costume."
+)
+_STYLE_ANIME = "High quality anime style (2D/2.5D)."
+
+_BG_INSTRUCTION = (
+    "The background must MATCH Image 2 (The Character Reference) content/scene. "
+    "CRITICAL: The background must be rendered as a REAL PHOTOGRAPH, not anime. "
+    "It must look like a real location photographed on 1990s film (grain, depth of field)."
+)
+
+_SWAP_INSTRUCTION_TEMPLATE = (
+    "You are an expert art director + Character Designer. "
+    "Image 1 is the POSE AND FRAMING REFERENCE (posture, camera angle, zoom level). "
+    "Image 2 is the CHARACTER AND BACKGROUND REFERENCE. "
+    "Write a detailed image generation prompt to generate a new image where:\n"
+    "1. The Subject is the CHARACTER from Image 2 (Same face, same outfit, same hair).\n"
+    "2. The Background involves the SAME SCENE as Image 2 but rendered as a PHOTO.\n"
+    "3. The Pose/Action matches Image 1 EXACTLY.\n"
+    "4. The Camera Angle, Framing, and Field of View MUST match Image 1 EXACTLY (e.g. if Image 1 is a close-up, output a close-up).\n"
+    "5. The Art Style is: %s\n"
+    "Output ONLY the prompt description text."
+)
+
+_FRAMING_CONSTRAINT = " Match the EXACT camera angle, framing, crop,  character posture , and composition of reference image_1. Do not zoom out if image_1 is a close-up."
+
+_SWAP_INSTRUCTIONS = {
+    False: _SWAP_INSTRUCTION_TEMPLATE % _STYLE_ANIME,
+    True: _SWAP_INSTRUCTION_TEMPLATE % _STYLE_COSPLAY,
+}
+_SWAP_SUFFIXES = {
+    False: f" {_STYLE_ANIME} {_BG_INSTRUCTION}{_FRAMING_CONSTRAINT}",
+    True: f" {_STYLE_COSPLAY} {_BG_INSTRUCTION}{_FRAMING_CONSTRAINT}",
+}
+
 def swap_first_frame(video_path, char_ref_path, output_frame_path):
     """
     Extracts first frame of video, uses Gemini to create a prompt combining pose + char + bg,
@@ -51,50 +214,24 @@ def swap_first_frame(video_path, char_ref_path, output_frame_path):
     
     # 1. Extract Frame
     try:
-        clip = VideoFileClip(video_path)
         if not os.path.exists(TEMP_TRIM_DIR): os.makedirs(TEMP_TRIM_DIR)
         temp_first_frame = os.path.join(TEMP_TRIM_DIR, f"first_{os.path.basename(video_path)}.png")
         
-        clip.save_frame(temp_first_frame, t=0)
-        clip.close()
+        _extract_first_frame(video_path, temp_first_frame)
     except Exception as e:
         print(f"      ❌ Error extracting frame: {e}")
         return None, None
 
     # 2. Init Service
     try:
-        service = GeminiService()
+        service = _gemini()
     except Exception as e:
         print(f"      ❌ Error init GeminiService: {e}")
         return None, None
 
     # 3. Generate Prompt
     is_cosplay = "_cosplay" in os.path.basename(char_ref_path)
-    style_instruction = (
-        "PHOTOREALISTIC 1990s COSPLAY PHOTO. "
-        "The subject must look like a REAL HUMAN in a costume." 
-        if is_cosplay else 
-        "High quality anime style (2D/2.5D)."
-    )
-    
-    bg_instruction = (
-        "The background must MATCH Image 2 (The Character Reference) content/scene. "
-        "CRITICAL: The background must be rendered as a REAL PHOTOGRAPH, not anime. "
-        "It must look like a real location photographed on 1990s film (grain, depth of field)."
-    )
-
-    instruction = (
-        "You are an expert art director + Character Designer. "
-        "Image 1 is the POSE AND FRAMING REFERENCE (posture, camera angle, zoom level). "
-        "Image 2 is the CHARACTER AND BACKGROUND REFERENCE. "
-        "Write a detailed image generation prompt to generate a new image where:\n"
-        "1. The Subject is the CHARACTER from Image 2 (Same face, same outfit, same hair).\n"
-        "2. The Background involves the SAME SCENE as Image 2 but rendered as a PHOTO.\n"
-        "3. The Pose/Action matches Image 1 EXACTLY.\n"
-        "4. The Camera Angle, Framing, and Field of View MUST match Image 1 EXACTLY (e.g. if Image 1 is a close-up, output a close-up).\n"
-        f"5. The Art Style is: {style_instruction}\n"
-        "Output ONLY the prompt description text."
-    )
+    instruction = _SWAP_INSTRUCTIONS[is_cosplay]
     
     print("      🧠 Generating Prompt with Gemini...")
     context_images = [temp_first_frame]
@@ -108,8 +245,7 @@ def swap_first_frame(video_path, char_ref_path, output_frame_path):
             return None, None
             
         # Enforce Constraints
-        prompt += f" {style_instruction} {bg_instruction}" 
-        prompt += " Match the EXACT camera angle, framing, crop,  character posture , and composition of reference image_1. Do not zoom out if image_1 is a close-up."
+        prompt += _SWAP_SUFFIXES[is_cosplay]
     except Exception as e:
         print(f"      ❌ Error generating prompt: {e}")
         return None, None
@@ -150,24 +286,36 @@ def submit_kling_job(final_image_path, video_path):
     print(f"\n🚀 Submitting Kling Job: {os.path.basename(video_path)} with {os.path.basename(final_image_path)}")
     
     # Setup Auth
-    fal_key = load_fal_key()
-    if not fal_key: return None
-    os.environ["FAL_KEY"] = fal_key
+    if not load_fal_key(): return None
     
     # Init Gemini
     try:
-        service = GeminiService()
+        service = _gemini()
     except:
         service = None
 
     upload_video_path = video_path
     temp_trim_path = None
 
+    video_prompt = "an anime girl dancing with still camera."
+    analysis_instruction = (
+        "Describe this image in 1 sentence for a text-to-video generator. "
+        "Focus on the subject and the setting. "
+        "Add dynamic keywords suitable for a dance video (e.g., 'character dancing', 'cinematic lighting', '4k'). "
+        "If there are background elements (trains, trees, lights), mention them moving slightly. "
+        "Keep it under 30 words."
+    )
+
+    # Gemini prompt + FAL uploads are independent network calls: run them together
+    pool = ThreadPoolExecutor(max_workers=3)
     try:
-        # Check Trim logic
+        f_prompt = pool.submit(service.generate_text, analysis_instruction, context_files=[final_image_path]) if service else None
+        print(f"   📤 Uploading Swapped Frame... {final_image_path}")
+        f_img = pool.submit(_fal().upload_file, final_image_path)
+
+        # Check Trim logic (overlaps with the prompt + image upload)
         orientation = "video" # Default, will be overridden if needed
-        clip = VideoFileClip(video_path)
-        duration = clip.duration
+        duration = _video_duration(video_path)
         
         max_duration = 15.0 # User requested limit to avoid upload errors
         
@@ -176,43 +324,26 @@ def submit_kling_job(final_image_path, video_path):
             if not os.path.exists(TEMP_TRIM_DIR): os.makedirs(TEMP_TRIM_DIR)
             temp_trim_path = os.path.join(TEMP_TRIM_DIR, f"trim_{os.path.basename(video_path)}.mp4")
             
-            # Use safe subclip
-            sub = clip.subclipped(0, max_duration)
-            sub.write_videofile(temp_trim_path, codec="libx264", audio_codec="aac", logger=None)
-            sub.close()
+            _trim_video(video_path, temp_trim_path, max_duration)
             upload_video_path = temp_trim_path
         else:
             upload_video_path = video_path
-            
-        clip.close()
 
-        # Generate Prompt
-        video_prompt = "an anime girl dancing with still camera."
-        if service:
-            analysis_instruction = (
-                "Describe this image in 1 sentence for a text-to-video generator. "
-                "Focus on the subject and the setting. "
-                "Add dynamic keywords suitable for a dance video (e.g., 'character dancing', 'cinematic lighting', '4k'). "
-                "If there are background elements (trains, trees, lights), mention them moving slightly. "
-                "Keep it under 30 words."
-            )
+        print(f"   📤 Uploading Video... {upload_video_path}")
+        f_vid = pool.submit(_fal().upload_file, upload_video_path)
+
+        if f_prompt:
             try:
-                gen_prompt = service.generate_text(analysis_instruction, context_files=[final_image_path])
+                gen_prompt = f_prompt.result()
                 if gen_prompt: video_prompt = gen_prompt.strip()
             except: pass
 
-        # Upload
-        print(f"   📤 Uploading Swapped Frame... {final_image_path}")
-        image_url = fal_client.upload_file(final_image_path)
-        print(f"   📤 Uploading Video... {upload_video_path}")
-        video_url = fal_client.upload_file(upload_video_path)
-        
-        print("   ⏳ Waiting 2s for upload...")
-        time.sleep(2)
+        image_url = f_img.result()
+        video_url = f_vid.result()
 
         # Submit Async
         print(f"   📡 Sending Request to FAL...")
-        handler = fal_client.submit(
+        handler = _fal().submit(
             "fal-ai/kling-video/v2.6/pro/motion-control",
             arguments={
                 "image_url": image_url,
@@ -232,52 +363,67 @@ def submit_kling_job(final_image_path, video_path):
     except Exception as e:
         print(f"❌ Submission Failed: {e}")
         return None
+    finally:
+        # Drop work that hasn't started and wait out in-flight uploads, so no
+        # thread outlives a failed submission
+        pool.shutdown(wait=True, cancel_futures=True)
 
 # NOTE: The original process_kling_video is REMOVED to force using the new batch flow, 
 # or aliased to a synchronous wrapper if needed. For now I replace it with these components.
 
-def process_active_jobs(job_list):
+def _await_one(job):
     """
-    Waits for a list of jobs to finish and downloads results.
+    Waits for a single job to finish and downloads its result.
     """
-    for job in job_list:
-        handler = job["handler"]
-        out_path = job["final_output"]
-        
-        print(f"   ⏳ Waiting for result: {os.path.basename(out_path)}...")
+    handler = job["handler"]
+    out_path = job["final_output"]
+    
+    print(f"   ⏳ Waiting for result: {os.path.basename(out_path)}...")
+    try:
+        # Iterating events helps keep connection alive usually, or just .get()
+        result = None
         try:
-            # Iterating events helps keep connection alive usually, or just .get()
-            result = None
-            try:
-                for event in handler.iter_events(with_logs=True):
-                    if isinstance(event, fal_client.InProgress):
-                        pass
-            except:
-                pass
-            
-            # Get final result
-            result = handler.get()
-            
-            if result and "video" in result and "url" in result["video"]:
-                download_url = result["video"]["url"]
-                print(f"      ✅ Generated! Downloading...")
-                resp = requests.get(download_url)
+            for event in handler.iter_events(with_logs=True):
+                if isinstance(event, _fal().InProgress):
+                    pass
+        except:
+            pass
+        
+        # Get final result
+        result = handler.get()
+        
+        if result and "video" in result and "url" in result["video"]:
+            download_url = result["video"]["url"]
+            print(f"      ✅ Generated! Downloading...")
+            # Stream to disk instead of buffering the whole video in memory
+            with _http().get(download_url, stream=True, timeout=(5, 120)) as resp:
                 if resp.status_code == 200:
                     with open(out_path, "wb") as f:
-                        f.write(resp.content)
+                        for chunk in resp.iter_content(chunk_size=1 << 20):
+                            f.write(chunk)
                     print(f"      💾 Saved: {out_path}")
                 else:
                     print(f"      ❌ Download error: {resp.status_code}")
-            else:
-                print(f"      ❌ API Error: {result}")
+        else:
+            print(f"      ❌ API Error: {result}")
+    
+    except Exception as e:
+        print(f"      ❌ Exception waiting for job: {e}")
         
-        except Exception as e:
-            print(f"      ❌ Exception waiting for job: {e}")
-            
-        # Cleanup temp trim if it exists
-        if job.get("temp_trim") and os.path.exists(job["temp_trim"]):
-            try: os.remove(job["temp_trim"])
-            except: pass
+    # Cleanup temp trim if it exists
+    if job.get("temp_trim") and os.path.exists(job["temp_trim"]):
+        try: os.remove(job["temp_trim"])
+        except: pass
+
+def process_active_jobs(job_list):
+    """
+    Waits for a list of jobs to finish and downloads results.
+    Jobs are awaited concurrently (FAL runs them in parallel server-side).
+    """
+    if not job_list:
+        return
+    with ThreadPoolExecutor(max_workers=min(8, len(job_list))) as pool:
+        list(pool.map(_await_one, job_list))
 
 if __name__ == "__main__":
     print("Please use run_batch_kling.py to execute the batch.")
@@ -1,5 +1,6 @@
 import os
 import sys
+import functools
 
 # Add path for imports
 # Add path for imports
@@ -11,6 +12,11 @@ try:
 except ImportError:
     from services.gemini_service import GeminiService
 
+@functools.lru_cache(maxsize=1)
+def _gemini():
+    """Process-wide GeminiService, built on first use"""
+    return GeminiService()
+
 def create_cosplay_version(input_path, output_path, service=None, character_name=None, anime_name=None):
     """
     Converts an anime image into a photorealistic 1990s cosplay photo.
@@ -22,7 +28,7 @@ def create_cosplay_version(input_path, output_path, service=None, character_name
     print(f"📸 Creating Cosplay Version: {os.path.basename(input_path)} -> {os.path.basename(output_path)}")
 
     if service is None:
-        service = GeminiService()
+        service = _gemini()
 
     # Step 1: Analyze the Anime Image to get details
     print("      🧠 Analyzing image for scene and outfit details...")
@@ -71,9 +77,6 @@ def create_cosplay_version(input_path, output_path, service=None, character_name
         "NO ANIME FACES. NO CARTOON TEXTURES. PURE PHOTOREALISM."
     )
 
-    if service is None:
-        service = GeminiService()
-    
     # Use edit_image for structure preservation
     success = service.edit_image(
         input_path=input_path,
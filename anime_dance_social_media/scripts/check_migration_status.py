@@ -3,152 +3,184 @@ Cloud Migration Status Check Script
 Checks GCS and Firestore to verify all dance videos have been uploaded.
 """
 import sys
+from itertools import compress, islice
 from pathlib import Path
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 # Add project root to path
 ROOT = Path(__file__).parent.parent
 sys.path.insert(0, str(ROOT))
 
-from services.gcs_service import GCSService
-from services.firestore_service import FirestoreService
+from services.gcs_service import get_gcs_service
+from services.firestore_service import get_firestore_service
+from utils.path_utils import PATH_GCS, classify_path, scan_suffix
 
+# Asset keys that hold a dance video, and every key that holds a file path
+DANCE_KEYS = ("dance_video", "primary_dance_video", "DELIVERABLE")
+PATH_KEYS = DANCE_KEYS + ("cosplay_image", "anime_image")
 
-def check_migration_status():
-    print("=" * 60)
-    print("🔍 CLOUD MIGRATION STATUS CHECK")
-    print("=" * 60)
+
+def _collect_status(out):
+    """Run the checks, passing each report line to out(); returns the summary dict"""
+    out("=" * 60)
+    out("🔍 CLOUD MIGRATION STATUS CHECK")
+    out("=" * 60)
 
     # 1. GCS Check
-    print("\n📦 GCS STORAGE CHECK")
-    print("-" * 40)
-    gcs = GCSService()
+    out("\n📦 GCS STORAGE CHECK")
+    out("-" * 40)
+    gcs = get_gcs_service()
+
+    # One streamed listing (names only), tallied page by page instead of a LIST per prefix
+    dance_videos = dance_images = char_files = remix_files = total_files = 0
+    for b in gcs.bucket.list_blobs(
+        prefix=f"{gcs.BASE_PREFIX}/", fields="items(name),nextPageToken"
+    ):
+        name = b.name
+        total_files += 1
+        if name.startswith("anime_dance/dances/"):
+            if name.endswith(".mp4"):
+                dance_videos += 1
+            elif name.endswith(".png"):
+                dance_images += 1
+        elif name.startswith("anime_dance/characters/"):
+            char_files += 1
+        elif name.startswith("anime_dance/remixes/"):
+            remix_files += 1
 
     # List all dances
-    dance_files = gcs.list_files(prefix="anime_dance/dances/")
-    dance_videos = [f for f in dance_files if f.endswith(".mp4")]
-    dance_images = [f for f in dance_files if f.endswith(".png")]
-    print(f"   Dance videos in GCS: {len(dance_videos)}")
-    print(f"   Dance images (thumbnails/swapped): {len(dance_images)}")
+    out(f"   Dance videos in GCS: {dance_videos}")
+    out(f"   Dance images (thumbnails/swapped): {dance_images}")
 
     # List characters
-    char_files = gcs.list_files(prefix="anime_dance/characters/")
-    print(f"   Character files in GCS: {len(char_files)}")
+    out(f"   Character files in GCS: {char_files}")
 
     # List remixes
-    remix_files = gcs.list_files(prefix="anime_dance/remixes/")
-    print(f"   Remix files in GCS: {len(remix_files)}")
+    out(f"   Remix files in GCS: {remix_files}")
 
     # Total summary
-    total_files = len(gcs.list_files())
-    print(f"\n   📊 Total files in anime_dance/*: {total_files}")
+    out(f"\n   📊 Total files in anime_dance/*: {total_files}")
 
     # 2. Firestore Check
-    print("\n🔥 FIRESTORE CHECK")
-    print("-" * 40)
-    fs = FirestoreService()
+    out("\n🔥 FIRESTORE CHECK")
+    out("-" * 40)
+    fs = get_firestore_service()
 
-    char_count = fs.get_character_count()
-    print(f"   Total characters in Firestore: {char_count}")
+    # One fetch (name + assets only) feeds the counts and the path check below
+    all_chars = fs.get_all_characters(fields=["name", "assets"])
+    char_count = len(all_chars)
+    out(f"   Total characters in Firestore: {char_count}")
 
-    # Get all characters and count assets
-    all_chars = fs.get_all_characters()
     total_assets = 0
     chars_with_dances = 0
     dance_count_total = 0
+    # Every populated path value and its (char name, key), classified in one pass below
+    paths = []
+    owners = []
 
     for char in all_chars:
         assets = char.get("assets", [])
         total_assets += len(assets)
+        char_name = char.get("name")
+        char_dances = 0
         for asset in assets:
-            dance = (
-                asset.get("dance_video")
-                or asset.get("primary_dance_video")
-                or asset.get("DELIVERABLE")
-            )
-            if dance:
-                chars_with_dances += 1
-                break
-        # Count actual dance entries
-        for asset in assets:
-            if (
-                asset.get("dance_video")
-                or asset.get("primary_dance_video")
-                or asset.get("DELIVERABLE")
-            ):
-                dance_count_total += 1
+            # Flag written by FirestoreService; assets saved before it existed
+            # fall back to the first populated dance key
+            has_dance = asset.get("_has_dance")
+            if has_dance is None:
+                has_dance = next((k for k in DANCE_KEYS if asset.get(k)), None)
+            if has_dance:
+                char_dances += 1
+            for key in PATH_KEYS:
+                val = asset.get(key)
+                if val:
+                    paths.append(val)
+                    owners.append((char_name, key))
+        dance_count_total += char_dances
+        if char_dances:
+            chars_with_dances += 1
+
+    if np is not None and paths:
+        # Vectorized prefix test instead of a Python call per path
+        is_gcs = np.char.startswith(np.asarray(paths, dtype=str), "gs://")
+        gcs_paths = int(is_gcs.sum())
+        is_local = ~is_gcs
+    else:
+        is_gcs = [classify_path(v) == PATH_GCS for v in paths]
+        gcs_paths = sum(is_gcs)
+        is_local = [not g for g in is_gcs]
+    local_paths = len(paths) - gcs_paths
+    path_examples = {
+        "gcs": [
+            {"char": owners[i][0], "key": owners[i][1], "path": paths[i]}
+            for i in islice(compress(range(len(paths)), is_gcs), 3)
+        ],
+        "local": [
+            {"char": owners[i][0], "key": owners[i][1], "path": paths[i]}
+            for i in islice(compress(range(len(paths)), is_local), 5)
+        ],
+    }
 
-    print(f"   Total assets across all characters: {total_assets}")
-    print(f"   Characters with dance videos: {chars_with_dances}")
-    print(f"   Total dance video entries: {dance_count_total}")
+    out(f"   Total assets across all characters: {total_assets}")
+    out(f"   Characters with dance videos: {chars_with_dances}")
+    out(f"   Total dance video entries: {dance_count_total}")
 
     # 3. Path verification - check if paths in Firestore are GCS URIs
-    print("\n🔗 PATH VERIFICATION (GCS vs Local)")
-    print("-" * 40)
-    
-    gcs_paths = 0
-    local_paths = 0
-    path_examples = {"gcs": [], "local": []}
-    
-    for char in all_chars:
-        for asset in char.get("assets", []):
-            for key in ["dance_video", "primary_dance_video", "DELIVERABLE", "cosplay_image", "anime_image"]:
-                val = asset.get(key)
-                if val:
-                    if val.startswith("gs://"):
-                        gcs_paths += 1
-                        if len(path_examples["gcs"]) < 3:
-                            path_examples["gcs"].append({"char": char.get("name"), "key": key, "path": val})
-                    else:
-                        local_paths += 1
-                        if len(path_examples["local"]) < 5:
-                            path_examples["local"].append({"char": char.get("name"), "key": key, "path": val})
-
-    print(f"   ✅ GCS URIs found: {gcs_paths}")
-    print(f"   ❌ Local paths found: {local_paths}")
+    out("\n🔗 PATH VERIFICATION (GCS vs Local)")
+    out("-" * 40)
+
+    out(f"   ✅ GCS URIs found: {gcs_paths}")
+    out(f"   ❌ Local paths found: {local_paths}")
     
     if gcs_paths > 0:
-        print("\n   Sample GCS paths:")
+        out("\n   Sample GCS paths:")
         for ex in path_examples["gcs"]:
-            print(f"      {ex['char']} - {ex['key']}: {ex['path'][:70]}...")
+            out(f"      {ex['char']} - {ex['key']}: {ex['path'][:70]}...")
     
     if local_paths > 0:
-        print("\n   ⚠️ WARNING: Local paths detected (not migrated):")
+        out("\n   ⚠️ WARNING: Local paths detected (not migrated):")
         for ex in path_examples["local"]:
-            print(f"      {ex['char']} - {ex['key']}: {ex['path'][:50]}...")
+            out(f"      {ex['char']} - {ex['key']}: {ex['path'][:50]}...")
 
     # 4. Comparison - Local vs Cloud
-    print("\n📊 LOCAL VS CLOUD COMPARISON")
-    print("-" * 40)
+    out("\n📊 LOCAL VS CLOUD COMPARISON")
+    out("-" * 40)
     
-    import os
     local_dances_dir = ROOT / "output" / "dances"
     if local_dances_dir.exists():
-        local_dance_videos = [f for f in local_dances_dir.iterdir() if f.suffix == ".mp4"]
-        local_dance_images = [f for f in local_dances_dir.iterdir() if f.suffix == ".png"]
-        print(f"   Local dance videos: {len(local_dance_videos)}")
-        print(f"   Local dance images: {len(local_dance_images)}")
-        print(f"   GCS dance videos: {len(dance_videos)}")
-        print(f"   GCS dance images: {len(dance_images)}")
+        # One directory scan, split by extension
+        local_dance_videos = []
+        local_dance_images = []
+        for e in scan_suffix(local_dances_dir, {"mp4", "png"}):
+            (local_dance_videos if e.name.endswith(".mp4") else local_dance_images).append(e)
+        out(f"   Local dance videos: {len(local_dance_videos)}")
+        out(f"   Local dance images: {len(local_dance_images)}")
+        out(f"   GCS dance videos: {dance_videos}")
+        out(f"   GCS dance images: {dance_images}")
         
         # Migration status
-        video_diff = len(local_dance_videos) - len(dance_videos)
+        video_diff = len(local_dance_videos) - dance_videos
         if video_diff == 0:
-            print(f"\n   ✅ VIDEO MIGRATION: COMPLETE (all {len(local_dance_videos)} videos uploaded)")
+            out(f"\n   ✅ VIDEO MIGRATION: COMPLETE (all {len(local_dance_videos)} videos uploaded)")
         elif video_diff > 0:
-            print(f"\n   ⚠️ VIDEO MIGRATION: INCOMPLETE ({video_diff} videos not yet uploaded)")
+            out(f"\n   ⚠️ VIDEO MIGRATION: INCOMPLETE ({video_diff} videos not yet uploaded)")
         else:
-            print(f"\n   ✅ VIDEO MIGRATION: MORE FILES IN CLOUD ({-video_diff} extra in GCS)")
+            out(f"\n   ✅ VIDEO MIGRATION: MORE FILES IN CLOUD ({-video_diff} extra in GCS)")
 
     # 5. Generate summary
-    print("\n" + "=" * 60)
-    print("📋 MIGRATION SUMMARY")
-    print("=" * 60)
+    out("\n" + "=" * 60)
+    out("📋 MIGRATION SUMMARY")
+    out("=" * 60)
     
     summary = {
-        "gcs_dance_videos": len(dance_videos),
-        "gcs_dance_images": len(dance_images),
-        "gcs_character_files": len(char_files),
-        "gcs_remix_files": len(remix_files),
+        "gcs_dance_videos": dance_videos,
+        "gcs_dance_images": dance_images,
+        "gcs_character_files": char_files,
+        "gcs_remix_files": remix_files,
         "gcs_total_files": total_files,
         "firestore_characters": char_count,
         "firestore_total_assets": total_assets,
@@ -160,12 +192,21 @@ def check_migration_status():
     }
     
     for key, value in summary.items():
-        print(f"   {key}: {value}")
+        out(f"   {key}: {value}")
     
-    print("\n" + "=" * 60)
+    out("\n" + "=" * 60)
     
     return summary
 
 
+def check_migration_status():
+    # Report lines are buffered and written in one go at the end
+    lines = []
+    try:
+        return _collect_status(lines.append)
+    finally:
+        sys.stdout.write("\n".join(lines) + "\n")
+
+
 if __name__ == "__main__":
     check_migration_status()
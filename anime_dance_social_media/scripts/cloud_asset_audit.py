@@ -12,8 +12,22 @@ from collections import defaultdict
 ROOT = Path(__file__).parent.parent
 sys.path.insert(0, str(ROOT))
 
-from services.firestore_service import FirestoreService
-from services.gcs_service import GCSService
+from services.firestore_service import get_firestore_service
+from services.gcs_service import get_gcs_service
+from utils.path_utils import PATH_GCS, PATH_LOCAL_WIN, classify_path, scan_suffix
+
+# Only the fields the audit reads are sent over the wire
+AUDIT_FIELDS = ["name", "anime", "assets"]
+
+def _path_label(v):
+    """Short display form of an asset path for the report"""
+    kind = classify_path(v)
+    return "[GCS]" if kind == PATH_GCS else "[LOCAL]" if kind == PATH_LOCAL_WIN else v[:50]
+
+def iter_characters_once(fs):
+    """Yields (doc_id, data) for every character from one projected read, with subcollection assets merged in"""
+    for char in fs.get_all_characters(fields=AUDIT_FIELDS):
+        yield char["id"], char
 
 def audit_assets():
     print("=" * 80)
@@ -21,8 +35,8 @@ def audit_assets():
     print("=" * 80)
     
     # Initialize services
-    fs = FirestoreService()
-    gcs = GCSService()
+    fs = get_firestore_service()
+    gcs = get_gcs_service()
     
     # Paths
     OUTPUT_DIR = ROOT / "output"
@@ -34,9 +48,13 @@ def audit_assets():
     print("\n[LOCAL ASSETS INVENTORY]")
     print("-" * 80)
     
-    local_chars = list(CHARACTERS_DIR.glob("*.png")) if CHARACTERS_DIR.exists() else []
-    local_dances = list(DANCES_DIR.glob("*.mp4")) if DANCES_DIR.exists() else []
-    local_remix_dirs = [d for d in REMIXES_DIR.iterdir() if d.is_dir()] if REMIXES_DIR.exists() else []
+    local_chars = list(scan_suffix(CHARACTERS_DIR, {"png"})) if CHARACTERS_DIR.exists() else []
+    local_dances = list(scan_suffix(DANCES_DIR, {"mp4"})) if DANCES_DIR.exists() else []
+    if REMIXES_DIR.exists():
+        with os.scandir(REMIXES_DIR) as it:
+            local_remix_dirs = [e for e in it if e.is_dir()]
+    else:
+        local_remix_dirs = []
     
     print(f"Character Images: {len(local_chars)}")
     print(f"Dance Videos: {len(local_dances)}")
@@ -45,7 +63,7 @@ def audit_assets():
     # Analyze character pairs
     char_base_names = set()
     for char_file in local_chars:
-        name = char_file.stem.replace("_cosplay", "").replace("_anime", "")
+        name = os.path.splitext(char_file.name)[0].replace("_cosplay", "").replace("_anime", "")
         char_base_names.add(name)
     
     print(f"Unique Characters: {len(char_base_names)}")
@@ -66,9 +84,10 @@ def audit_assets():
         if "ai_hoshino" in f.name.lower():
             ai_hoshino_files["characters"].append(f.name)
     
+    # (name, size) captured from the scandir entry so the print below doesn't re-stat
     for f in local_dances:
         if "ai_hoshino" in f.name.lower():
-            ai_hoshino_files["dances"].append(f.name)
+            ai_hoshino_files["dances"].append((f.name, f.stat().st_size))
     
     # Check remix directory
     ai_hoshino_remix_dir = REMIXES_DIR / "dance_ai_hoshino_1770337530_cosplay_on_AbjwLnB_E_E"
@@ -76,30 +95,32 @@ def audit_assets():
         print(f"Remix directory exists: {ai_hoshino_remix_dir.name}")
         
         # Files in root
-        for f in ai_hoshino_remix_dir.glob("*.mp4"):
+        for f in scan_suffix(ai_hoshino_remix_dir, {"mp4"}):
             ai_hoshino_files["remixes"].append(f.name)
         
         # Variants folder
         variants_dir = ai_hoshino_remix_dir / "variants"
         if variants_dir.exists():
-            for f in variants_dir.glob("*"):
-                ai_hoshino_files["variants"].append(f"variants/{f.name}")
+            with os.scandir(variants_dir) as it:
+                for f in it:
+                    if not f.name.startswith("."):
+                        ai_hoshino_files["variants"].append(f"variants/{f.name}")
         
         # Result folder (soundtracks)
         result_dir = ai_hoshino_remix_dir / "result"
         if result_dir.exists():
-            for f in result_dir.glob("*"):
-                if "soundtrack" in f.name.lower() or f.suffix in ['.mp3', '.mp4']:
-                    ai_hoshino_files["soundtracks"].append(f"result/{f.name}")
+            with os.scandir(result_dir) as it:
+                for f in it:
+                    if "soundtrack" in f.name.lower() or os.path.splitext(f.name)[1] in ('.mp3', '.mp4'):
+                        ai_hoshino_files["soundtracks"].append(f"result/{f.name}")
     
     print(f"\nCharacter Assets:")
     for f in sorted(ai_hoshino_files["characters"]):
         print(f"  [OK] {f}")
     
     print(f"\nDance Video:")
-    for f in sorted(ai_hoshino_files["dances"]):
-        size_mb = (DANCES_DIR / f).stat().st_size / (1024*1024)
-        print(f"  [OK] {f} ({size_mb:.1f} MB)")
+    for name, size in sorted(ai_hoshino_files["dances"]):
+        print(f"  [OK] {name} ({size / (1024*1024):.1f} MB)")
     
     print(f"\nRemix Files:")
     for f in sorted(ai_hoshino_files["remixes"]):
@@ -117,21 +138,28 @@ def audit_assets():
     print("\n[FIRESTORE DATABASE CHECK]")
     print("-" * 80)
     
+    # One pass over the collection also collects the local-path hits reported
+    # in the mismatch summary below
+    local_path_docs = []
+    firestore_error = None
     try:
-        chars_ref = fs.db.collection("characters").stream()
         firestore_chars = []
         firestore_count = 0
         
-        for doc in chars_ref:
-            data = doc.to_dict()
+        for doc_id, data in iter_characters_once(fs):
             firestore_count += 1
-            if "hoshino" in data.get("name", "").lower() or "ai_hoshino" in doc.id.lower():
+            if "hoshino" in data.get("name", "").lower() or "ai_hoshino" in doc_id.lower():
                 firestore_chars.append({
-                    "id": doc.id,
+                    "id": doc_id,
                     "name": data.get("name"),
                     "anime": data.get("anime"),
                     "assets": data.get("assets", [])
                 })
+            for asset in data.get("assets", []):
+                dance = asset.get("dance_video") or ""
+                image = asset.get("cosplay_image") or ""
+                if classify_path(dance) == PATH_LOCAL_WIN or classify_path(image) == PATH_LOCAL_WIN:
+                    local_path_docs.append(doc_id)
         
         print(f"Total characters in Firestore: {firestore_count}")
         
@@ -146,12 +174,13 @@ def audit_assets():
                     dance = asset.get('dance_video', 'N/A')
                     cosplay = asset.get('cosplay_image', 'N/A')
                     print(f"    Asset {i+1}:")
-                    print(f"      Dance: {'[GCS]' if dance.startswith('gs://') else '[LOCAL]' if dance.startswith('C:') else dance[:50]}")
-                    print(f"      Image: {'[GCS]' if cosplay.startswith('gs://') else '[LOCAL]' if cosplay.startswith('C:') else cosplay[:50]}")
+                    print(f"      Dance: {_path_label(dance)}")
+                    print(f"      Image: {_path_label(cosplay)}")
         else:
             print("\n[WARN] AI Hoshino NOT FOUND in Firestore!")
             
     except Exception as e:
+        firestore_error = e
         print(f"[ERROR] querying Firestore: {e}")
     
     # 4. GCS CHECK
@@ -160,31 +189,41 @@ def audit_assets():
     
     try:
         bucket = gcs.bucket
-        blobs = list(bucket.list_blobs(prefix="anime_dance/"))
-        
-        gcs_chars = [b for b in blobs if "/characters/" in b.name and b.name.endswith('.png')]
-        gcs_dances = [b for b in blobs if "/dances/" in b.name and b.name.endswith('.mp4')]
-        gcs_remixes = [b for b in blobs if "/remixes/" in b.name and b.name.endswith('.mp4')]
-        
-        print(f"Characters in GCS: {len(gcs_chars)}")
-        print(f"Dances in GCS: {len(gcs_dances)}")
-        print(f"Remixes in GCS: {len(gcs_remixes)}")
-        
-        # Check Ai Hoshino specifically
+        # Names only (no metadata/ACLs per item), partitioned in one pass
+        gcs_chars = []
+        gcs_dances = []
+        gcs_remixes = []
         ai_hoshino_gcs = {
             "characters": [],
             "dances": [],
             "remixes": []
         }
         
-        for b in blobs:
-            if "ai_hoshino" in b.name.lower():
-                if "/characters/" in b.name:
-                    ai_hoshino_gcs["characters"].append(b.name)
-                elif "/dances/" in b.name:
-                    ai_hoshino_gcs["dances"].append(b.name)
-                elif "/remixes/" in b.name:
-                    ai_hoshino_gcs["remixes"].append(b.name)
+        for b in bucket.list_blobs(prefix="anime_dance/", fields="items(name),nextPageToken"):
+            name = b.name
+            ext = name[-4:]
+            if "/characters/" in name:
+                kind = "characters"
+                if ext == '.png':
+                    gcs_chars.append(name)
+            elif "/dances/" in name:
+                kind = "dances"
+                if ext == '.mp4':
+                    gcs_dances.append(name)
+            elif "/remixes/" in name:
+                kind = "remixes"
+                if ext == '.mp4':
+                    gcs_remixes.append(name)
+            else:
+                continue
+            # Check Ai Hoshino specifically
+            lname = name.lower()
+            if "ai_hoshino" in lname:
+                ai_hoshino_gcs[kind].append(name)
+        
+        print(f"Characters in GCS: {len(gcs_chars)}")
+        print(f"Dances in GCS: {len(gcs_dances)}")
+        print(f"Remixes in GCS: {len(gcs_remixes)}")
         
         if ai_hoshino_gcs["characters"] or ai_hoshino_gcs["dances"] or ai_hoshino_gcs["remixes"]:
             print(f"\nAI Hoshino in GCS:")
@@ -220,25 +259,16 @@ def audit_assets():
     
     # Check for local paths in Firestore
     print("\n[Checking Firestore for local paths...]")
-    try:
-        chars_ref = fs.db.collection("characters").stream()
-        local_path_count = 0
-        for doc in chars_ref:
-            data = doc.to_dict()
-            for asset in data.get("assets", []):
-                dance = asset.get("dance_video", "")
-                image = asset.get("cosplay_image", "")
-                if dance.startswith("C:") or image.startswith("C:"):
-                    local_path_count += 1
-                    print(f"  [LOCAL PATH] found in {doc.id}")
+    if firestore_error is not None:
+        print(f"[ERROR] {firestore_error}")
+    else:
+        for doc_id in local_path_docs:
+            print(f"  [LOCAL PATH] found in {doc_id}")
         
-        if local_path_count == 0:
+        if not local_path_docs:
             print("  [OK] All paths are GCS URIs")
         else:
-            print(f"  [WARN] {local_path_count} assets still have local paths")
-            
-    except Exception as e:
-        print(f"[ERROR] {e}")
+            print(f"  [WARN] {len(local_path_docs)} assets still have local paths")
     
     print("\n" + "=" * 80)
     print("AUDIT COMPLETE")
@@ -1,15 +1,15 @@
-from services.firestore_service import FirestoreService
+from services.firestore_service import get_firestore_service
 import json
 
-fs = FirestoreService()
-docs = fs.db.collection('characters').stream()
+fs = get_firestore_service()
+# Only 'assets' is read (array elements can't be projected individually),
+# merged with any assets that only exist in the asset subcollection
+characters = fs.get_all_characters(fields=['assets'])
 
 print(f"{'ID':<30} | {'Dance':<7} | {'Cosplay':<7}")
 print("-" * 50)
 
-count = 0
-for d in docs:
-    data = d.to_dict()
+for data in characters:
     assets = data.get("assets", [])
     has_dance = False
     has_cosplay = False
@@ -19,8 +19,8 @@ for d in docs:
         has_dance = bool(primary.get("dance_video"))
         has_cosplay = bool(primary.get("cosplay_image"))
         
-    print(f"{d.id:<30} | {str(has_dance):<7} | {str(has_cosplay):<7}")
-    count += 1
+    print(f"{data['id']:<30} | {str(has_dance):<7} | {str(has_cosplay):<7}")
 
 print("-" * 50)
-print(f"Total characters: {count}")
+# Server-side COUNT aggregation
+print(f"Total characters: {fs.get_character_count()}")
@@ -5,51 +5,60 @@ Finalize Cloud Sync
 """
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Add project root to path
 ROOT = Path(__file__).parent.parent
 sys.path.insert(0, str(ROOT))
 
-from services.gcs_service import GCSService
-from services.firestore_service import FirestoreService
+from services.gcs_service import get_gcs_service
+from services.firestore_service import get_firestore_service
+from utils.path_utils import scan_suffix
+
+# Uploads are independent HTTPS round-trips
+MAX_WORKERS = 32
+
+SUFFIXES = {"mp4", "png", "jpg", "jpeg", "mp3"}
 
 def finalize():
     print("="*60)
     print("🚀 FINALIZE CLOUD MIGRATION")
     print("="*60)
     
-    gcs = GCSService()
-    fs = FirestoreService()
+    gcs = get_gcs_service()
+    fs = get_firestore_service()
     
     # 1. Scan output directory and upload missing files
     print("\n📤 Syncing raw files from output/ to GCS...")
     output_dir = ROOT / "output"
-    extensions = [".mp4", ".png", ".jpg", ".jpeg", ".mp3"]
-    
-    files_to_check = []
-    for root, dirs, files in os.walk(output_dir):
-        for file in files:
-            if any(file.lower().endswith(ext) for ext in extensions):
-                files_to_check.append(os.path.join(root, file))
-                
+    files_to_check = [e.path for e in scan_suffix(output_dir, SUFFIXES, recursive=True)] if output_dir.exists() else []
+
     print(f"   Found {len(files_to_check)} local files to verify.")
     
-    uploaded = 0
-    skipped = 0
-    for i, local_path in enumerate(files_to_check):
+    # Index what's already in the bucket with one paginated, names-only LIST
+    # instead of a HEAD request per local file
+    existing = {
+        b.name for b in gcs.bucket.list_blobs(
+            prefix=f"{gcs.BASE_PREFIX}/", fields="items(name),nextPageToken"
+        )
+    }
+    print(f"   Indexed {len(existing)} objects already in GCS.")
+    
+    def upload(local_path):
         try:
-            gcs_path = gcs._get_gcs_path(local_path)
-            if not gcs.file_exists(gcs_path):
-                gcs.upload_file(local_path)
-                uploaded += 1
-            else:
-                skipped += 1
-            
-            if (i+1) % 50 == 0:
-                print(f"   Processed {i+1}/{len(files_to_check)}...")
+            gcs.upload_file(local_path)
+            return True
         except Exception as e:
-            print(f"   ❌ Error checking {Path(local_path).name}: {e}")
+            print(f"   ❌ Error uploading {Path(local_path).name}: {e}")
+            return False
+    
+    missing_files = [p for p in files_to_check if gcs._get_gcs_path(p) not in existing]
+    skipped = len(files_to_check) - len(missing_files)
+    print(f"   {len(missing_files)} files missing from GCS.")
+    
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        uploaded = sum(pool.map(upload, missing_files))
             
     print(f"✅ GCS Upload Sync: {uploaded} uploaded, {skipped} already in cloud.")
 
@@ -59,11 +68,12 @@ def finalize():
     repaired = 0
     missing = 0
     
+    # Resolve every broken path first: (char, asset, key, local_path)
+    repairs = []
     for char in chars:
         char_id = char.get("id")
         name = char.get("name", char_id)
         assets = char.get("assets", [])
-        changed = False
         
         for asset in assets:
             for key in ["anime_image", "cosplay_image", "dance_video", "primary_dance_video", "DELIVERABLE", "motion_ref_video"]:
@@ -87,16 +97,33 @@ def finalize():
                     
                     if local_path.exists():
                         print(f"   📍 Repairing {name} ({key}): Uploading {local_path.name}")
-                        gcs_uri = gcs.upload_file(str(local_path))
-                        asset[key] = gcs_uri
-                        changed = True
-                        repaired += 1
+                        repairs.append((char, asset, key, local_path))
                     else:
                         print(f"   ⚠️ Still missing: {name} ({key}) -> {val}")
                         missing += 1
-        
-        if changed:
-            fs.save_character(char)
+    
+    def repair_upload(local_path):
+        try:
+            return gcs.upload_file(str(local_path))
+        except Exception as e:
+            print(f"   ❌ Error uploading {local_path.name}: {e}")
+            return None
+    
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        uris = list(pool.map(repair_upload, [r[3] for r in repairs]))
+    
+    changed = {}
+    for (char, asset, key, _), gcs_uri in zip(repairs, uris):
+        if gcs_uri:
+            asset[key] = gcs_uri
+            changed[char["id"]] = char
+            repaired += 1
+    
+    # One BulkWriter for all repaired characters instead of a commit per character
+    bulk = fs.bulk()
+    for char in changed.values():
+        fs.save_character(char, writer=bulk)
+    bulk.close()
             
     print(f"\n✅ Firestore Repair Complete:")
     print(f"   • Repaired: {repaired}")
@@ -1,14 +1,15 @@
-from services.firestore_service import FirestoreService
+from services.firestore_service import get_firestore_service
 
-fs = FirestoreService()
-docs = fs.db.collection('characters').stream()
+fs = get_firestore_service()
+# One indexed single-doc query on the mirrored `has_dance` flag
+# (only 'assets' is read; array elements can't be projected individually)
+char = fs.find_dance_character(fields=['assets'])
 
-for d in docs:
-    data = d.to_dict()
-    assets = data.get('assets', [])
-    if assets:
-        primary = assets[0]
-        if primary.get('dance_video'): # Found one with dance video
-            print(f"Found ready: {d.id}")
-            print(f"Keys: {list(primary.keys())}")
-            break
+if char:
+    primary = next(
+        (a for a in char.get('assets', [])
+         if (a['_has_dance'] if '_has_dance' in a else any(a.get(k) for k in fs.DANCE_FIELDS))),
+        {}
+    )
+    print(f"Found ready: {char['id']}")
+    print(f"Keys: {list(primary.keys())}")
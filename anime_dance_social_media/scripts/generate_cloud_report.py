@@ -10,14 +10,14 @@ from pathlib import Path
 ROOT = Path(__file__).parent.parent
 sys.path.insert(0, str(ROOT))
 
-from services.gcs_service import GCSService
-from services.firestore_service import FirestoreService
+from services.gcs_service import get_gcs_service
+from services.firestore_service import get_firestore_service
 
 def generate_report():
     report_path = ROOT / "CLOUD_MIGRATION_REPORT.md"
     
-    gcs = GCSService()
-    fs = FirestoreService()
+    gcs = get_gcs_service()
+    fs = get_firestore_service()
     
     # GCS Data
     dance_files = gcs.list_files(prefix="anime_dance/dances/")
@@ -1,7 +1,7 @@
-from services.firestore_service import FirestoreService
+from services.firestore_service import get_firestore_service
 import json
 
-fs = FirestoreService()
+fs = get_firestore_service()
 docs = fs.db.collection('characters').limit(5).stream()
 
 for d in docs:
@@ -12,24 +12,37 @@ Target Files:
 """
 
 import os
+import re
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Add project root to path
 ROOT = Path(__file__).parent.parent
 sys.path.insert(0, str(ROOT))
 
-from services.gcs_service import GCSService
-from services.firestore_service import FirestoreService
+from services.gcs_service import get_gcs_service
+from services.firestore_service import get_firestore_service
 from config import config
 
+# Uploads are independent, I/O-bound HTTPS streams
+UPLOAD_WORKERS = 8
+
+def _file_names(path):
+    """Names in path (empty if it doesn't exist), from a single scandir"""
+    try:
+        with os.scandir(path) as it:
+            return {e.name for e in it}
+    except FileNotFoundError:
+        return set()
+
 def migrate_remixes(dry_run=False):
     print("\n" + "="*60)
     print("   🚀 Migrating Final Remixes to Cloud")
     print("="*60 + "\n")
 
-    gcs = GCSService()
-    firestore = FirestoreService()
+    gcs = get_gcs_service()
+    firestore = get_firestore_service()
     
     remixes_dir = ROOT / "output" / "remixes"
     if not remixes_dir.exists():
@@ -40,6 +53,10 @@ def migrate_remixes(dry_run=False):
     print("📖 Fetching characters from Firestore...")
     characters = firestore.get_all_characters()
     char_map = {c['id']: c for c in characters}
+    # Longest IDs first so the alternation prefers the most specific match
+    char_id_rx = re.compile("|".join(
+        re.escape(cid) for cid in sorted(char_map, key=len, reverse=True)
+    )) if char_map else None
     print(f"   Total characters: {len(characters)}")
 
     # 2. Iterate through remix folders
@@ -48,6 +65,10 @@ def migrate_remixes(dry_run=False):
 
     uploaded_count = 0
     updated_count = 0
+    
+    # Folders with files to upload: (char_id, ref_id, asset_title, target_char, {label: future})
+    pending = []
+    pool = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS)
 
     for folder in remix_folders:
         folder_name = folder.name
@@ -65,11 +86,8 @@ def migrate_remixes(dry_run=False):
         if not char_id or char_id not in char_map:
             # Fallback: maybe the folder name is different?
             # Let's try to find an ID that is contained in the folder name
-            matched_id = None
-            for cid in char_map:
-                if cid in folder_name:
-                    matched_id = cid
-                    break
+            m = char_id_rx.search(folder_name) if char_id_rx else None
+            matched_id = m.group(0) if m else None
             
             if matched_id:
                 char_id = matched_id
@@ -103,42 +121,50 @@ def migrate_remixes(dry_run=False):
         
         # Result subfolder
         result_dir = folder / "result"
+        # One directory listing per folder; the pattern checks below are set lookups
+        result_names = _file_names(result_dir)
         
         # Pattern 1: [kpop_soundtrack]_REMIX_JENNIE_{...}_watermarked.mp4
-        kpop_path = result_dir / f"[kpop_soundtrack]_REMIX_JENNIE_{folder_name}_watermarked.mp4"
-        if kpop_path.exists():
-            files_to_upload["remix_kpop_watermarked"] = str(kpop_path)
+        kpop_name = f"[kpop_soundtrack]_REMIX_JENNIE_{folder_name}_watermarked.mp4"
+        if kpop_name in result_names:
+            files_to_upload["remix_kpop_watermarked"] = str(result_dir / kpop_name)
         
         # Pattern 2: [orig_soundtrack]_REMIX_JENNIE_{...}_watermarked.mp4
-        orig_path = result_dir / f"[orig_soundtrack]_REMIX_JENNIE_{folder_name}_watermarked.mp4"
-        if orig_path.exists():
-            files_to_upload["remix_orig_watermarked"] = str(orig_path)
+        orig_name = f"[orig_soundtrack]_REMIX_JENNIE_{folder_name}_watermarked.mp4"
+        if orig_name in result_names:
+            files_to_upload["remix_orig_watermarked"] = str(result_dir / orig_name)
             
         # Pattern 3: REMIX_JENNIE_{...}_structured_scored_watermarked.mp4
-        struc_path = result_dir / f"REMIX_JENNIE_{folder_name}_structured_scored_watermarked.mp4"
-        if not struc_path.exists():
-            struc_path = folder / f"REMIX_JENNIE_{folder_name}_structured_scored_watermarked.mp4"
-            
-        if struc_path.exists():
-            files_to_upload["remix_structured_watermarked"] = str(struc_path)
+        struc_name = f"REMIX_JENNIE_{folder_name}_structured_scored_watermarked.mp4"
+        if struc_name in result_names:
+            files_to_upload["remix_structured_watermarked"] = str(result_dir / struc_name)
+        elif struc_name in _file_names(folder):
+            files_to_upload["remix_structured_watermarked"] = str(folder / struc_name)
 
         if not files_to_upload:
             print(f"   ⚠️  No target watermarked files found in this folder. Skipping.")
             continue
 
-        # 5. Upload to GCS and update Firestore
+        # 5. Upload to GCS (in the background; Firestore is updated below)
         if dry_run:
             print(f"   🔍 Dry run: Would upload {len(files_to_upload)} files for {char_id} (Asset: {asset_title})")
             continue
 
+        uploads = {
+            label: pool.submit(gcs.upload_file, local_path)
+            for label, local_path in files_to_upload.items()
+        }
+        pending.append((char_id, ref_id, asset_title, target_char, uploads))
+
+    # 6. Update Firestore as each folder's uploads finish
+    for char_id, ref_id, asset_title, target_char, uploads in pending:
         updates = {}
-        for label, local_path in files_to_upload.items():
+        for label, future in uploads.items():
             try:
-                gcs_uri = gcs.upload_file(local_path)
-                updates[label] = gcs_uri
+                updates[label] = future.result()
                 uploaded_count += 1
             except Exception as e:
-                print(f"   ❌ Error uploading {label}: {e}")
+                print(f"   ❌ Error uploading {label} for {char_id}: {e}")
 
         if updates:
             # Check if asset exists in Firestore record (local map might be stale but firestore is source of truth)
@@ -163,6 +189,8 @@ def migrate_remixes(dry_run=False):
                 updated_count += 1
             else:
                 print(f"   ❌ Failed to update Firestore for {char_id}")
+    
+    pool.shutdown()
 
     print("\n" + "="*60)
     print("   ✅ REMIX MIGRATION COMPLETE")
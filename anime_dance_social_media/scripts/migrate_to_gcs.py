@@ -14,27 +14,104 @@ import os
 import sys
 import json
 import argparse
+import mimetypes
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
 # Add project root to path
 ROOT = Path(__file__).parent.parent
 sys.path.insert(0, str(ROOT))
 
-from services.gcs_service import GCSService
-from services.firestore_service import FirestoreService
+from google.cloud.storage import transfer_manager
 
+from services.gcs_service import get_gcs_service
+from services.firestore_service import get_firestore_service
 
-def load_local_character_db() -> list:
-    """Load the existing character_db.json."""
+# Uploads are dominated by HTTPS round-trips, so many can overlap
+MIGRATE_WORKERS = int(os.getenv("MIGRATE_WORKERS", "32"))
+
+# Above this size character_db.json is stream-parsed instead of loaded whole
+STREAM_PARSE_BYTES = 64 * 1024 * 1024
+
+# Sidecar of finished (local_path, gcs_uri) pairs, so an aborted run resumes
+# without re-checking or re-uploading them. Removed once a run completes.
+MIGRATION_STATE = ROOT / "output" / ".migration_state.jsonl"
+CHECKPOINT_EVERY = 100  # Uploads per batch between checkpoint writes
+
+# Attempts per Firestore write before the BulkWriter gives up on it
+BULK_MAX_ATTEMPTS = 15
+
+
+def iter_local_characters():
+    """
+    Yield characters from character_db.json one at a time.
+    Files up to STREAM_PARSE_BYTES are parsed in one shot (orjson when it's
+    installed); larger ones are parsed incrementally with ijson when it's
+    installed, so the raw file text is never held alongside the parsed characters.
+    """
     db_path = ROOT / "output" / "characters" / "character_db.json"
     
     if not db_path.exists():
         print(f"❌ Character DB not found: {db_path}")
-        return []
+        return
+    
+    if ijson is not None and db_path.stat().st_size > STREAM_PARSE_BYTES:
+        with open(db_path, "rb") as f:
+            yield from ijson.items(f, "item", use_float=True)
+        return
+    
+    if orjson is not None:
+        yield from orjson.loads(db_path.read_bytes())
+        return
     
     with open(db_path, "r", encoding="utf-8") as f:
-        return json.load(f)
+        yield from json.load(f)
+
+
+def load_local_character_db() -> list:
+    """Load the existing character_db.json."""
+    # The migration revisits characters after the uploads, so they're kept
+    return list(iter_local_characters())
+
+
+def load_migration_state() -> dict:
+    """local_path -> gcs_uri recorded by earlier, unfinished runs."""
+    mapping = {}
+    if not MIGRATION_STATE.exists():
+        return mapping
+    
+    with open(MIGRATION_STATE, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # Blank or torn line from an interrupted write
+            mapping[entry["local_path"]] = entry["gcs_uri"]
+    return mapping
+
+
+def append_migration_state(entries: list):
+    """Append (local_path, gcs_uri) pairs to the sidecar and fsync it."""
+    if not entries:
+        return
+    with open(MIGRATION_STATE, "a", encoding="utf-8") as f:
+        f.write("".join(
+            json.dumps({"local_path": p, "gcs_uri": uri}) + "\n" for p, uri in entries
+        ))
+        f.flush()
+        os.fsync(f.fileno())
 
 
 def backup_character_db():
@@ -45,11 +122,8 @@ def backup_character_db():
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         backup_path = ROOT / "output" / "characters" / f"character_db_backup_{timestamp}.json"
         
-        with open(db_path, "r", encoding="utf-8") as f:
-            data = f.read()
-        
-        with open(backup_path, "w", encoding="utf-8") as f:
-            f.write(data)
+        # Kernel-side copy (sendfile/copy_file_range), no Python-side buffer
+        shutil.copyfile(db_path, backup_path)
         
         print(f"   💾 Backup created: {backup_path.name}")
         return backup_path
@@ -62,10 +136,8 @@ def collect_files_to_upload(characters: list) -> list:
     Extract all file paths from character data that need uploading.
     
     Returns:
-        List of tuples: (local_path, gcs_path, field_name, char_id, asset_idx)
+        List of dicts: {local_path, field, char_id, char_idx, asset_idx}
     """
-    files = []
-    
     # File fields to check in assets
     file_fields = [
         "anime_image",
@@ -75,29 +147,36 @@ def collect_files_to_upload(characters: list) -> list:
         "DELIVERABLE"
     ]
     
-    for char in characters:
-        char_id = char.get("id", "unknown")
-        
-        for asset_idx, asset in enumerate(char.get("assets", [])):
-            for field in file_fields:
-                path_value = asset.get(field)
-                
-                if path_value and isinstance(path_value, str):
-                    # Skip if already a GCS path
-                    if path_value.startswith("gs://"):
-                        continue
-                    
-                    # Check if file exists
-                    local_path = Path(path_value)
-                    if local_path.exists():
-                        files.append({
-                            "local_path": str(local_path),
-                            "field": field,
-                            "char_id": char_id,
-                            "asset_idx": asset_idx
-                        })
-    
-    return files
+    # Every non-GCS path value, flattened so the stat() calls can run concurrently
+    candidates = [
+        {
+            "local_path": str(Path(path_value)),
+            "field": field,
+            "char_id": char.get("id", "unknown"),
+            "char_idx": char_idx,
+            "asset_idx": asset_idx
+        }
+        for char_idx, char in enumerate(characters)
+        for asset_idx, asset in enumerate(char.get("assets", []))
+        for field in file_fields
+        if (path_value := asset.get(field))
+        and isinstance(path_value, str)
+        and not path_value.startswith("gs://")
+    ]
+    
+    with ThreadPoolExecutor(max_workers=MIGRATE_WORKERS) as pool:
+        exists = list(pool.map(os.path.exists, (c["local_path"] for c in candidates)))
+    
+    return [c for c, ok in zip(candidates, exists) if ok]
+
+
+def _blob_for(gcs, local_path: str, gcs_path: str):
+    """Blob at gcs_path, with the content type upload_file() would set for local_path."""
+    blob = gcs.bucket.blob(gcs_path)
+    content_type, _ = mimetypes.guess_type(local_path)
+    if content_type:
+        blob.content_type = content_type
+    return blob
 
 
 def run_migration(dry_run: bool = False):
@@ -140,62 +219,118 @@ def run_migration(dry_run: bool = False):
     
     # Step 4: Initialize services
     print("\n🌐 Initializing cloud services...")
-    gcs = GCSService()
-    firestore = FirestoreService()
+    gcs = get_gcs_service()
+    firestore = get_firestore_service()
     
     # Step 5: Upload files and build path mapping
     print("\n📤 Uploading files to GCS...")
-    path_mapping = {}  # local_path -> gcs_uri
+    path_mapping = load_migration_state()  # local_path -> gcs_uri
     
     uploaded = 0
     skipped = 0
     errors = 0
     
-    for i, file_info in enumerate(files_to_upload):
-        local_path = file_info["local_path"]
-        
-        try:
-            # Check if already exists in GCS
-            gcs_path = gcs._get_gcs_path(local_path)
-            
-            if gcs.file_exists(gcs_path):
-                skipped += 1
-                gcs_uri = f"gs://{gcs.BUCKET_NAME}/{gcs_path}"
+    resumed = sum(1 for p in {f["local_path"] for f in files_to_upload} if p in path_mapping)
+    if resumed:
+        print(f"   ♻️  Resuming: {resumed} files already recorded in {MIGRATION_STATE.name}")
+        skipped += resumed
+    
+    # Index what's already in the bucket with one names-only LIST per top-level
+    # folder, instead of a HEAD request per file (keyed by local path, so a file
+    # shared by several assets is only checked and uploaded once)
+    gcs_paths = {
+        f["local_path"]: gcs._get_gcs_path(f["local_path"])
+        for f in files_to_upload if f["local_path"] not in path_mapping
+    }
+    prefixes = set()
+    for gcs_path in gcs_paths.values():
+        parts = gcs_path.split("/")
+        prefixes.add("/".join(parts[:2]) + "/" if len(parts) > 2 else parts[0] + "/")
+    existing = set()
+    for prefix in sorted(prefixes):
+        if any(prefix.startswith(p) for p in prefixes if p != prefix):
+            continue  # Covered by a shorter prefix
+        existing.update(
+            b.name for b in gcs.bucket.list_blobs(prefix=prefix, fields="items(name),nextPageToken")
+        )
+    
+    pending = []
+    found = []
+    for local_path, gcs_path in gcs_paths.items():
+        if gcs_path in existing:
+            found.append((local_path, f"gs://{gcs.BUCKET_NAME}/{gcs_path}"))
+            skipped += 1
+        else:
+            pending.append(local_path)
+    path_mapping.update(found)
+    append_migration_state(found)
+    
+    print(f"   {len(pending)} files missing from GCS")
+    # Uploaded in batches so finished files are checkpointed as they complete
+    for start in range(0, len(pending), CHECKPOINT_EVERY):
+        batch = pending[start:start + CHECKPOINT_EVERY]
+        blobs = [_blob_for(gcs, p, gcs_paths[p]) for p in batch]
+        # Failures come back as exception objects in the results list
+        results = transfer_manager.upload_many(
+            list(zip(batch, blobs)),
+            max_workers=MIGRATE_WORKERS,
+            worker_type=transfer_manager.THREAD,
+            raise_exception=False,
+        )
+        done = []
+        for local_path, blob, result in zip(batch, blobs, results):
+            if isinstance(result, Exception):
+                print(f"   ❌ Error uploading {Path(local_path).name}: {result}")
+                errors += 1
             else:
-                gcs_uri = gcs.upload_file(local_path)
+                done.append((local_path, f"gs://{gcs.BUCKET_NAME}/{blob.name}"))
                 uploaded += 1
-            
-            path_mapping[local_path] = gcs_uri
-            
-            # Progress
-            if (i + 1) % 50 == 0:
-                print(f"   Progress: {i + 1}/{len(files_to_upload)}")
-                
-        except Exception as e:
-            print(f"   ❌ Error uploading {Path(local_path).name}: {e}")
-            errors += 1
+        path_mapping.update(done)
+        append_migration_state(done)
+        print(f"   Progress: {min(start + CHECKPOINT_EVERY, len(pending))}/{len(pending)}")
     
     print(f"\n   ✅ Uploaded: {uploaded}, Skipped: {skipped}, Errors: {errors}")
     
     # Step 6: Update character data with GCS paths
     print("\n🔄 Updating character paths...")
     
-    for char in characters:
-        for asset in char.get("assets", []):
-            for field in ["anime_image", "cosplay_image", "dance_video", 
-                          "motion_ref_video", "DELIVERABLE"]:
-                old_path = asset.get(field)
-                if old_path and old_path in path_mapping:
-                    asset[field] = path_mapping[old_path]
+    # Patch exactly the fields that were collected, rather than re-scanning every asset
+    for file_info in files_to_upload:
+        gcs_uri = path_mapping.get(file_info["local_path"])
+        if gcs_uri:
+            asset = characters[file_info["char_idx"]]["assets"][file_info["asset_idx"]]
+            asset[file_info["field"]] = gcs_uri
     
     # Step 7: Write to Firestore
     print("\n🔥 Writing to Firestore...")
     
+    # One BulkWriter batches the writes instead of a commit per character.
+    # Its commits run in the background, so failures surface through the
+    # error callback rather than as exceptions from save_character().
+    fs_failures = []
+    
+    def _on_write_error(failure, _writer):
+        if failure.attempts < BULK_MAX_ATTEMPTS:
+            return True  # retry with backoff
+        fs_failures.append(failure)
+        print(f"   ❌ Error writing {failure.operation.reference.path}: {failure.message}")
+        return False
+    
+    bulk = firestore.bulk()
+    bulk.on_write_error(_on_write_error)
     for char in characters:
         try:
-            firestore.save_character(char)
+            firestore.save_character(char, writer=bulk)
         except Exception as e:
+            fs_failures.append(e)
             print(f"   ❌ Error saving {char.get('id')}: {e}")
+    bulk.close()
+    if fs_failures:
+        print(f"   ⚠️  {len(fs_failures)} Firestore writes failed")
+    
+    # Nothing left to resume once every upload and Firestore write succeeded
+    if errors == 0 and not fs_failures:
+        MIGRATION_STATE.unlink(missing_ok=True)
     
     print(f"\n   ✅ Migrated {len(characters)} characters to Firestore")
     
@@ -209,6 +344,7 @@ Summary:
    • Files uploaded: {uploaded}
    • Files skipped (already exist): {skipped}
    • Errors: {errors}
+   • Firestore write failures: {len(fs_failures)}
    
 Next steps:
    1. Verify data in GCS Console
@@ -10,8 +10,8 @@ from pathlib import Path
 ROOT = Path(__file__).parent.parent
 sys.path.insert(0, str(ROOT))
 
-from services.gcs_service import GCSService
-from services.firestore_service import FirestoreService
+from services.gcs_service import get_gcs_service
+from services.firestore_service import get_firestore_service
 
 def verify():
     print("\n" + "="*60)
@@ -20,7 +20,7 @@ def verify():
 
     # 1. Verify GCS
     print("🌐 Verifying GCS Storage...")
-    gcs = GCSService()
+    gcs = get_gcs_service()
     gcs_status = gcs.test_connection()
     print(f"   Bucket: {gcs_status.get('bucket')} (Status: {gcs_status.get('status')})")
     
@@ -31,7 +31,7 @@ def verify():
     
     # 2. Verify Firestore
     print("\n🔥 Verifying Firestore Database...")
-    firestore = FirestoreService()
+    firestore = get_firestore_service()
     fs_status = firestore.test_connection()
     print(f"   Collections: {fs_status.get('collections')} (Status: {fs_status.get('status')})")
     
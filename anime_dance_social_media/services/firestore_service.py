@@ -4,17 +4,97 @@ Handles character data, dance jobs, and Instagram post tracking.
 Uses nisan-n8n service account for authentication.
 """
 import os
+import time
+import random
+import string
+import functools
+import itertools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Optional, List, Dict, Any
 
-try:
-    from google.cloud import firestore
-    from google.oauth2 import service_account
-except ImportError:
-    raise ImportError("Please install google-cloud-firestore: pip install google-cloud-firestore")
+# .env is loaded once per process (other modules check the same flag)
+if not os.getenv("CONFIG_LOADED"):
+    from dotenv import load_dotenv
+    load_dotenv()
+    os.environ["CONFIG_LOADED"] = "1"
 
-from dotenv import load_dotenv
-load_dotenv()
+# The Firestore SDK is slow to import, so it's loaded on first use
+_firestore_module = None
+
+
+def _firestore():
+    """Return the google.cloud.firestore module, importing it on first call."""
+    global _firestore_module
+    if _firestore_module is None:
+        try:
+            from google.cloud import firestore
+        except ImportError:
+            raise ImportError("Please install google-cloud-firestore: pip install google-cloud-firestore")
+        _firestore_module = firestore
+    return _firestore_module
+
+
+# Bounded retry/deadline for Firestore RPCs (the SDK defaults retry for far longer)
+FS_TIMEOUT = 3.0
+FS_STREAM_TIMEOUT = 30.0  # Whole-collection scans need longer than a point read
+
+
+@functools.lru_cache(maxsize=None)
+def _fs_retry():
+    from google.api_core import retry
+    return retry.Retry(
+        predicate=retry.if_transient_error,
+        initial=0.1,
+        maximum=1.0,
+        multiplier=2.0,
+        deadline=5.0
+    )
+
+
+def rpc_opts(timeout: float = FS_TIMEOUT) -> dict:
+    """retry/timeout kwargs for Firestore get/set/update/add/stream/commit calls."""
+    return {"retry": _fs_retry(), "timeout": timeout}
+
+
+class _TTLCache:
+    """Small thread-safe LRU cache whose entries expire after `ttl` seconds."""
+    
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+    
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+            return default if item is None else item[1]
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
 
 
 class FirestoreService:
@@ -27,52 +107,137 @@ class FirestoreService:
     CREDENTIALS_PATH = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
     DATABASE_ID = os.getenv("FIRESTORE_DATABASE", "(default)")
     
+    # Clients (each with its own gRPC channel) shared by all instances, handed
+    # out round-robin so services don't pay a new handshake per construction
+    CLIENT_POOL_SIZE = max(1, int(os.getenv("FIRESTORE_CLIENT_POOL_SIZE", 4)))
+    _client_pool: List["firestore.Client"] = []
+    _client_cycle = None
+    _pool_lock = threading.Lock()
+    
+    # Per-process read caches shared by all instances; cleared on local writes.
+    # Cached dicts are shared between callers, so treat them as read-only.
+    _character_cache = _TTLCache(maxsize=2048, ttl=60)
+    _all_characters_cache = _TTLCache(maxsize=8, ttl=15)
+    
     # Collection names
     CHARACTERS_COLLECTION = "characters"
     DANCE_JOBS_COLLECTION = "dance_jobs"
     INSTAGRAM_POSTS_COLLECTION = "instagram_posts"
     
+    # Per-asset docs live in characters/{id}/assets/{title}. The `assets` array on
+    # the character doc is the legacy store; reads overlay the subcollection on it.
+    ASSETS_SUBCOLLECTION = "assets"
+    
+    # Set on the character doc when its asset subcollection holds writes the
+    # `assets` array doesn't have (cleared by save_character, which rewrites
+    # both). Only flagged characters pay for the subcollection read.
+    ASSETS_OVERLAY_FIELD = "assets_overlay"
+    
+    # Asset field that makes a character eligible for random reel publishing.
+    # Mirrored onto the character doc as `has_remix_orig` so it can be queried.
+    ELIGIBLE_REEL_FIELD = "remix_orig_watermarked"
+    
+    # Asset fields that hold a dance video. Mirrored onto each asset as
+    # `_has_dance`, and onto the character doc as `has_dance` so readers can
+    # query for it instead of scanning assets.
+    DANCE_FIELDS = ("dance_video", "primary_dance_video", "DELIVERABLE")
+    
     def __init__(self):
         """Initialize Firestore client with service account credentials."""
-        if self.CREDENTIALS_PATH and os.path.exists(self.CREDENTIALS_PATH):
+        self.db = self._pooled_client()
+    
+    @classmethod
+    def _create_client(cls) -> "firestore.Client":
+        firestore = _firestore()
+        if cls.CREDENTIALS_PATH and os.path.exists(cls.CREDENTIALS_PATH):
+            from google.oauth2 import service_account
             credentials = service_account.Credentials.from_service_account_file(
-                self.CREDENTIALS_PATH
+                cls.CREDENTIALS_PATH
             )
-            self.db = firestore.Client(
-                project=self.PROJECT_ID,
+            client = firestore.Client(
+                project=cls.PROJECT_ID,
                 credentials=credentials,
-                database=self.DATABASE_ID
+                database=cls.DATABASE_ID
             )
         else:
             # Fall back to default credentials (ADC)
-            self.db = firestore.Client(
-                project=self.PROJECT_ID,
-                database=self.DATABASE_ID
+            client = firestore.Client(
+                project=cls.PROJECT_ID,
+                database=cls.DATABASE_ID
             )
         
-        print(f"   🔥 Firestore Service initialized: {self.PROJECT_ID}/{self.DATABASE_ID}")
+        print(f"   🔥 Firestore Service initialized: {cls.PROJECT_ID}/{cls.DATABASE_ID}")
+        return client
+    
+    @classmethod
+    def _pooled_client(cls) -> "firestore.Client":
+        """Next client from the shared pool (filled lazily up to CLIENT_POOL_SIZE)."""
+        with cls._pool_lock:
+            if cls._client_cycle is None:
+                cls._client_pool.append(cls._create_client())
+                if len(cls._client_pool) < cls.CLIENT_POOL_SIZE:
+                    return cls._client_pool[-1]
+                cls._client_cycle = itertools.cycle(cls._client_pool)
+            return next(cls._client_cycle)
     
     # ========== Character Operations ==========
     
-    def save_character(self, character_data: dict) -> str:
+    def save_character(self, character_data: dict, writer=None, prune_assets: bool = False) -> str:
         """
         Save or update a character document.
         
         Args:
             character_data: Character dict with 'id', 'name', 'anime', 'assets', etc.
+            writer: Optional BulkWriter (see bulk()) to queue the writes on
+                    instead of committing them immediately
+            prune_assets: Also delete asset docs whose titles aren't in 'assets'
+                          (one extra list RPC, so off by default)
             
         Returns:
             Document ID
+        
+        `rand` is only written when the document is created. Writer saves skip
+        the existence check, so characters created through a BulkWriter get
+        their `rand` from rerandomize_reel_probes().
         """
         char_id = character_data.get("id")
         if not char_id:
             raise ValueError("Character data must include 'id' field")
         
         # Add timestamp
-        character_data["updated_at"] = firestore.SERVER_TIMESTAMP
+        character_data["updated_at"] = _firestore().SERVER_TIMESTAMP
+        if "assets" in character_data:
+            for asset in character_data["assets"] or []:
+                if isinstance(asset, dict):
+                    self._mark_dance(asset)
+            character_data["has_remix_orig"] = self._has_remix_orig(character_data["assets"])
+            character_data["has_dance"] = self._has_dance(character_data["assets"])
+            # The array below is written out in full, so nothing needs overlaying
+            character_data[self.ASSETS_OVERLAY_FIELD] = False
         
         doc_ref = self.db.collection(self.CHARACTERS_COLLECTION).document(char_id)
-        doc_ref.set(character_data, merge=True)
+        doc_data = character_data
+        if writer is None and "rand" not in character_data:
+            if not doc_ref.get(field_paths=["rand"], **rpc_opts()).exists:
+                # Random probe key for sample_eligible_reel(), set once at creation
+                doc_data = {**character_data, "rand": random.random()}
+        batch = writer or self.db.batch()
+        batch.set(doc_ref, doc_data, merge=True)
+        if "assets" in character_data:
+            # Asset docs mirror the array: replaced (not merged), and with
+            # prune_assets, docs for titles no longer in the array are deleted
+            titles = set()
+            for asset in character_data["assets"] or []:
+                if isinstance(asset, dict) and asset.get("title"):
+                    batch.set(self._asset_ref(char_id, asset["title"]), asset)
+                    titles.add(asset["title"])
+            if prune_assets:
+                for asset_ref in doc_ref.collection(self.ASSETS_SUBCOLLECTION).list_documents():
+                    if asset_ref.id not in titles:
+                        batch.delete(asset_ref)
+        if writer is None:
+            batch.commit(**rpc_opts())
+        self._invalidate(char_id)
         
         print(f"   💾 Saved character: {char_id}")
         return char_id
@@ -85,25 +250,175 @@ class FirestoreService:
             char_id: Character document ID
             
         Returns:
-            Character dict or None if not found
+            Character dict or None if not found (cached for up to 60s)
         """
+        cached = self._character_cache.get(char_id)
+        if cached is not None:
+            return cached
+        
         doc_ref = self.db.collection(self.CHARACTERS_COLLECTION).document(char_id)
-        doc = doc_ref.get()
+        doc = doc_ref.get(**rpc_opts())
         
         if doc.exists:
-            return doc.to_dict()
+            char = self._with_subcollection_assets([doc])[0]
+            self._character_cache.set(char_id, char)
+            return char
         return None
     
-    def get_all_characters(self) -> List[dict]:
+    def get_all_characters(self, fields: Optional[List[str]] = None) -> List[dict]:
         """
         Get all characters from Firestore.
         Replacement for load_character_db().
         
+        Args:
+            fields: Only fetch these top-level fields (e.g. ['id', 'name', 'assets'])
+        
         Returns:
-            List of character dicts
+            List of character dicts (cached for up to 15s)
+        """
+        cache_key = tuple(fields) if fields else "all"
+        cached = self._all_characters_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        query = self.db.collection(self.CHARACTERS_COLLECTION)
+        if fields:
+            query = query.select(self._overlay_fields(fields))
+        characters = self._with_subcollection_assets(query.stream(**rpc_opts(FS_STREAM_TIMEOUT)), fields)
+        self._all_characters_cache.set(cache_key, characters)
+        return characters
+    
+    def get_all_characters_parallel(self, shards: int = 8, fields: Optional[List[str]] = None) -> List[dict]:
         """
-        docs = self.db.collection(self.CHARACTERS_COLLECTION).stream()
-        return [doc.to_dict() for doc in docs]
+        Same as get_all_characters(), but streams `shards` document-ID ranges
+        concurrently instead of the whole collection over one stream.
+        
+        Shard boundaries split [0-9a-z] evenly on the first character of the ID;
+        the first and last shards are open-ended so no ID is missed.
+        """
+        cache_key = tuple(fields) if fields else "all"
+        cached = self._all_characters_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        collection = self.db.collection(self.CHARACTERS_COLLECTION)
+        alphabet = string.digits + string.ascii_lowercase
+        shards = max(1, min(shards, len(alphabet)))
+        bounds = [None] + [alphabet[i * len(alphabet) // shards] for i in range(1, shards)] + [None]
+        
+        def stream_shard(start: Optional[str], end: Optional[str]) -> list:
+            query = collection.order_by("__name__")
+            if fields:
+                query = query.select(self._overlay_fields(fields))
+            if start:
+                query = query.start_at({"__name__": collection.document(start)})
+            if end:
+                query = query.end_before({"__name__": collection.document(end)})
+            return list(query.stream(**rpc_opts(FS_STREAM_TIMEOUT)))
+        
+        with ThreadPoolExecutor(max_workers=shards) as pool:
+            parts = list(pool.map(stream_shard, bounds[:-1], bounds[1:]))
+        
+        characters = self._with_subcollection_assets(itertools.chain.from_iterable(parts), fields)
+        self._all_characters_cache.set(cache_key, characters)
+        return characters
+    
+    def _overlay_fields(self, fields: Optional[List[str]]) -> Optional[List[str]]:
+        """Add the overlay flag to a projection that fetches 'assets'."""
+        if fields and "assets" in fields and self.ASSETS_OVERLAY_FIELD not in fields:
+            return [*fields, self.ASSETS_OVERLAY_FIELD]
+        return fields
+    
+    def _with_subcollection_assets(self, docs, fields: Optional[List[str]] = None) -> List[dict]:
+        """
+        to_dict() each doc (with 'id'). If 'assets' was fetched, overlays the
+        subcollection assets of just the fetched docs flagged with
+        ASSETS_OVERLAY_FIELD, reading those subcollections concurrently.
+        """
+        chars = [{"id": doc.id, **doc.to_dict()} for doc in docs]
+        if fields and "assets" not in fields:
+            return chars
+        
+        flagged = [c["id"] for c in chars if c.get(self.ASSETS_OVERLAY_FIELD)]
+        if not flagged:
+            return chars
+        with ThreadPoolExecutor(max_workers=min(16, len(flagged))) as pool:
+            sub_assets = dict(zip(flagged, pool.map(self._asset_docs, flagged)))
+        for char in chars:
+            if char["id"] in sub_assets:
+                self._merge_assets(char, sub_assets[char["id"]])
+        return chars
+    
+    @classmethod
+    def _invalidate(cls, char_id: str) -> None:
+        """Drop cached reads affected by a write to this character."""
+        cls._character_cache.pop(char_id)
+        cls._all_characters_cache.clear()
+    
+    def _asset_ref(self, char_id: str, asset_title: str):
+        """Reference to characters/{char_id}/assets/{asset_title}."""
+        return (
+            self.db.collection(self.CHARACTERS_COLLECTION).document(char_id)
+            .collection(self.ASSETS_SUBCOLLECTION).document(asset_title)
+        )
+    
+    def _write_asset(self, char_id: str, asset_title: str, fields: dict, existing_only: bool = False) -> None:
+        """
+        Write asset fields to the subcollection and touch the parent doc in one batch.
+        Raises NotFound if the character doc (or, with existing_only, the asset doc)
+        doesn't exist.
+        
+        Setting a remix/dance field raises the parent's `has_remix_orig`/`has_dance`
+        flag in the same batch; clearing one recomputes both flags from all of
+        the character's assets afterwards.
+        """
+        char_ref = self.db.collection(self.CHARACTERS_COLLECTION).document(char_id)
+        parent_updates = {
+            "updated_at": _firestore().SERVER_TIMESTAMP,
+            self.ASSETS_OVERLAY_FIELD: True,
+        }
+        if fields.get(self.ELIGIBLE_REEL_FIELD):
+            # `rand` is set once by save_character; redraws are left to
+            # rerandomize_reel_probes so sampling stays uniform
+            parent_updates["has_remix_orig"] = True
+        if any(fields.get(k) for k in self.DANCE_FIELDS):
+            parent_updates["has_dance"] = True
+        
+        batch = self.db.batch()
+        if existing_only:
+            batch.update(self._asset_ref(char_id, asset_title), fields)
+        else:
+            batch.set(self._asset_ref(char_id, asset_title), fields, merge=True)
+        batch.update(char_ref, parent_updates)
+        batch.commit(**rpc_opts())
+        self._invalidate(char_id)
+        
+        flag_fields = (self.ELIGIBLE_REEL_FIELD, *self.DANCE_FIELDS)
+        if any(k in fields and not fields[k] for k in flag_fields):
+            self._refresh_parent_flags(char_id)
+    
+    def _refresh_parent_flags(self, char_id: str) -> None:
+        """Recompute the character's `has_remix_orig`/`has_dance` from its merged assets."""
+        char_ref = self.db.collection(self.CHARACTERS_COLLECTION).document(char_id)
+        doc = char_ref.get(field_paths=["assets"], **rpc_opts())
+        if not doc.exists:
+            return
+        char = self._merge_assets({"assets": doc.to_dict().get("assets") or []}, self._asset_docs(char_id))
+        char_ref.update({
+            "has_remix_orig": self._has_remix_orig(char["assets"]),
+            "has_dance": self._has_dance(char["assets"]),
+        }, **rpc_opts())
+        self._invalidate(char_id)
+    
+    def _legacy_asset(self, char_id: str, asset_title: str) -> Optional[dict]:
+        """Find an asset in the character's legacy `assets` array (not yet backfilled)."""
+        doc = self.db.collection(self.CHARACTERS_COLLECTION).document(char_id).get(**rpc_opts())
+        if not doc.exists:
+            return None
+        return next(
+            (a for a in doc.to_dict().get("assets") or [] if a.get("title") == asset_title),
+            None
+        )
     
     def update_character_asset(
         self, 
@@ -112,7 +427,8 @@ class FirestoreService:
         updates: dict
     ) -> bool:
         """
-        Update a specific asset within a character's assets array.
+        Update a specific asset (characters/{id}/assets/{title}) without
+        reading the character doc.
         
         Args:
             char_id: Character document ID
@@ -120,35 +436,37 @@ class FirestoreService:
             updates: Dict of fields to update within the asset
             
         Returns:
-            True if updated, False if character not found
+            True if updated, False if character or asset not found
         """
-        doc_ref = self.db.collection(self.CHARACTERS_COLLECTION).document(char_id)
-        doc = doc_ref.get()
+        from google.api_core.exceptions import NotFound
         
-        if not doc.exists:
-            return False
+        # Keep `_has_dance` in step with any dance field the update touches.
+        # Setting one flags the asset without a read; clearing one needs the
+        # asset's other dance fields unless the update covers them all.
+        touched = [k for k in self.DANCE_FIELDS if k in updates]
+        if touched:
+            has_dance = any(updates.get(k) for k in touched)
+            untouched = [k for k in self.DANCE_FIELDS if k not in updates]
+            if not has_dance and untouched:
+                current = self.get_character_asset(char_id, asset_title) or {}
+                has_dance = any(current.get(k) for k in untouched)
+            updates = {**updates, "_has_dance": has_dance}
+        
+        try:
+            self._write_asset(char_id, asset_title, updates, existing_only=True)
+        except NotFound:
+            # Asset only exists in the legacy array: copy it over with the updates
+            legacy = self._legacy_asset(char_id, asset_title)
+            if legacy is None:
+                return False
+            self._write_asset(char_id, asset_title, self._mark_dance({**legacy, **updates}))
         
-        char_data = doc.to_dict()
-        assets = char_data.get("assets", [])
-        
-        updated = False
-        # Find and update the matching asset
-        for asset in assets:
-            if asset.get("title") == asset_title:
-                asset.update(updates)
-                updated = True
-                break
-        
-        if updated:
-            # Save back
-            doc_ref.update({"assets": assets, "updated_at": firestore.SERVER_TIMESTAMP})
-            print(f"   📝 Updated asset '{asset_title}' for {char_id}")
-            return True
-        return False
+        print(f"   📝 Updated asset '{asset_title}' for {char_id}")
+        return True
 
     def add_character_asset(self, char_id: str, new_asset: dict) -> bool:
         """
-        Add a new asset to a character's assets list.
+        Add (or merge into) an asset in the character's assets subcollection.
         
         Args:
             char_id: Character ID
@@ -159,35 +477,206 @@ class FirestoreService:
         """
         if "title" not in new_asset:
             raise ValueError("Asset must include a 'title'")
-            
-        doc_ref = self.db.collection(self.CHARACTERS_COLLECTION).document(char_id)
-        doc = doc_ref.get()
         
-        if not doc.exists:
+        from google.api_core.exceptions import NotFound
+        
+        self._mark_dance(new_asset)
+        try:
+            self._write_asset(char_id, new_asset["title"], new_asset)
+        except NotFound:
             return False
+        
+        print(f"   ➕ Saved asset '{new_asset['title']}' for {char_id}")
+        return True
+    
+    def get_character_asset(self, char_id: str, asset_title: str) -> Optional[dict]:
+        """
+        Get a single asset by title (one document read).
+        Falls back to the legacy `assets` array for characters not yet backfilled.
+        """
+        doc = self._asset_ref(char_id, asset_title).get(**rpc_opts())
+        if doc.exists:
+            return doc.to_dict()
+        return self._legacy_asset(char_id, asset_title)
+    
+    def _asset_docs(self, char_id: str) -> List[dict]:
+        """All asset docs in one character's subcollection."""
+        query = self.db.collection(self.CHARACTERS_COLLECTION).document(char_id) \
+            .collection(self.ASSETS_SUBCOLLECTION)
+        return [{"title": doc.id, **doc.to_dict()} for doc in query.stream(**rpc_opts(FS_STREAM_TIMEOUT))]
+    
+    @staticmethod
+    def _merge_assets(char: dict, sub_assets: List[dict]) -> dict:
+        """Overlay subcollection assets onto the legacy array (matched by title)."""
+        if not sub_assets:
+            return char
+        legacy = char.get("assets")
+        merged = {a.get("title"): dict(a) for a in legacy if isinstance(a, dict)} \
+            if isinstance(legacy, list) else {}
+        for asset in sub_assets:
+            merged.setdefault(asset["title"], {}).update(asset)
+        char["assets"] = list(merged.values())
+        return char
+    
+    def backfill_asset_subcollections(self, char_id: Optional[str] = None) -> int:
+        """
+        Copy assets from the legacy `assets` array into characters/{id}/assets/{title}.
+        Existing subcollection fields win over array values. Also sets the
+        character's `has_dance` flag from the merged assets, and flags
+        characters that already had asset docs for overlaying on read.
+        
+        Args:
+            char_id: Only backfill this character (default: all characters)
             
-        char_data = doc.to_dict()
-        assets = char_data.get("assets", [])
-        
-        # Check if already exists, if so update it
-        for i, asset in enumerate(assets):
-            if asset.get("title") == new_asset["title"]:
-                assets[i].update(new_asset)
-                doc_ref.update({"assets": assets, "updated_at": firestore.SERVER_TIMESTAMP})
-                print(f"   📝 Updated existing asset '{new_asset['title']}' for {char_id}")
-                return True
+        Returns:
+            Number of asset docs written
+        """
+        collection = self.db.collection(self.CHARACTERS_COLLECTION)
+        docs = [collection.document(char_id).get(**rpc_opts())] if char_id else collection.stream(**rpc_opts(FS_STREAM_TIMEOUT))
+        
+        written = 0
+        bulk = self.bulk()
+        for doc in docs:
+            if not doc.exists:
+                continue
+            existing = {a["title"]: a for a in self._asset_docs(doc.id)}
+            merged = list(existing.values())
+            for asset in doc.to_dict().get("assets") or []:
+                title = asset.get("title") if isinstance(asset, dict) else None
+                if not title:
+                    continue
+                merged.append(asset)
+                bulk.set(self._asset_ref(doc.id, title), {**asset, **existing.get(title, {})})
+                written += 1
+            bulk.update(doc.reference, {
+                "has_dance": self._has_dance(merged),
+                self.ASSETS_OVERLAY_FIELD: bool(existing),
+            })
+            self._invalidate(doc.id)
+        bulk.close()
+        
+        print(f"   📦 Backfilled {written} asset docs")
+        return written
+    
+    @classmethod
+    def _has_remix_orig(cls, assets) -> bool:
+        """True if any asset has an original-soundtrack watermarked remix."""
+        return isinstance(assets, list) and any(
+            isinstance(a, dict) and a.get(cls.ELIGIBLE_REEL_FIELD) for a in assets
+        )
+    
+    @classmethod
+    def _has_dance(cls, assets) -> bool:
+        """True if any asset has a dance video."""
+        return isinstance(assets, list) and any(
+            isinstance(a, dict) and any(a.get(k) for k in cls.DANCE_FIELDS) for a in assets
+        )
+    
+    @classmethod
+    def _mark_dance(cls, asset: dict) -> dict:
+        """Set the asset's derived `_has_dance` flag in place and return it."""
+        asset["_has_dance"] = any(bool(asset.get(k)) for k in cls.DANCE_FIELDS)
+        return asset
+    
+    def find_dance_character(self, fields: Optional[List[str]] = None) -> Optional[dict]:
+        """
+        Get one character flagged with `has_dance` (single-doc indexed query).
+        
+        Args:
+            fields: Only fetch these fields (default: whole doc)
             
-        # Otherwise append new asset
-        assets.append(new_asset)
-        doc_ref.update({"assets": assets, "updated_at": firestore.SERVER_TIMESTAMP})
-        print(f"   ➕ Added new asset '{new_asset['title']}' for {char_id}")
-        return True
+        Returns:
+            Character dict with 'id', or None if no character is flagged
+        """
+        query = (
+            self.db.collection(self.CHARACTERS_COLLECTION)
+            .where("has_dance", "==", True)
+            .limit(1)
+        )
+        if fields:
+            query = query.select(self._overlay_fields(fields))
+        for doc in query.stream(**rpc_opts()):
+            return self._with_subcollection_assets([doc], fields)[0]
+        return None
+    
+    def query_eligible_reels(self, limit: int = 200) -> List[dict]:
+        """
+        Get characters flagged with `has_remix_orig`, fetching only the fields
+        needed to publish a random reel.
+        
+        Characters written before the flag existed are not returned.
+        
+        Args:
+            limit: Max results to return
+            
+        Returns:
+            List of partial character dicts (id, name, anime, assets)
+        """
+        return list(self.iter_eligible_reels(limit))
+    
+    def iter_eligible_reels(self, limit: int = 200):
+        """
+        Generator form of query_eligible_reels(): yields characters as the stream
+        delivers them, so callers can filter while later docs are in flight.
+        Only flagged characters' asset subcollections are read.
+        """
+        query = (
+            self.db.collection(self.CHARACTERS_COLLECTION)
+            .where("has_remix_orig", "==", True)
+            .select(self._overlay_fields(["id", "name", "anime", "assets"]))
+            .limit(limit)
+        )
+        for doc in query.stream(**rpc_opts(FS_STREAM_TIMEOUT)):
+            yield self._with_subcollection_assets([doc])[0]
+    
+    def sample_eligible_reel(self) -> Optional[dict]:
+        """
+        Pick one random `has_remix_orig` character with a single-doc probe on its
+        `rand` field (first doc at/after a random point, wrapping around).
+        Needs a composite index on (has_remix_orig, rand).
+        
+        Returns:
+            Partial character dict (id, name, anime, assets) or None if no
+            flagged character has a `rand` value yet
+        """
+        base = (
+            self.db.collection(self.CHARACTERS_COLLECTION)
+            .where("has_remix_orig", "==", True)
+            .select(self._overlay_fields(["id", "name", "anime", "assets"]))
+        )
+        r = random.random()
+        for query in (
+            base.where("rand", ">=", r).order_by("rand").limit(1),
+            base.where("rand", "<", r).order_by("rand").limit(1),
+        ):
+            for doc in query.stream(**rpc_opts()):
+                return self._with_subcollection_assets([doc])[0]
+        return None
+    
+    def rerandomize_reel_probes(self) -> int:
+        """
+        Assign a fresh `rand` to every character, so repeated sampling stays
+        uniform and characters saved before the field existed can be sampled.
+        Meant to run periodically (e.g. from Cloud Scheduler).
+        
+        Returns:
+            Number of characters updated
+        """
+        collection = self.db.collection(self.CHARACTERS_COLLECTION)
+        bulk = self.bulk()
+        count = 0
+        for doc in collection.select([]).stream(**rpc_opts(FS_STREAM_TIMEOUT)):
+            bulk.update(doc.reference, {"rand": random.random()})
+            count += 1
+        bulk.close()
+        return count
     
     def query_characters(
         self, 
         anime: Optional[str] = None,
         has_deliverable: Optional[bool] = None,
-        limit: int = 100
+        limit: int = 100,
+        fields: Optional[List[str]] = None
     ) -> List[dict]:
         """
         Query characters with filters.
@@ -196,6 +685,8 @@ class FirestoreService:
             anime: Filter by anime name
             has_deliverable: Filter by whether character has a deliverable video
             limit: Max results to return
+            fields: Only fetch these top-level fields ('assets' is added when
+                    filtering on has_deliverable)
             
         Returns:
             List of matching character dicts
@@ -205,9 +696,14 @@ class FirestoreService:
         if anime:
             query = query.where("anime", "==", anime)
         
+        if fields:
+            if has_deliverable is not None and "assets" not in fields:
+                fields = [*fields, "assets"]
+            query = query.select(self._overlay_fields(fields))
+        
         query = query.limit(limit)
         
-        results = [doc.to_dict() for doc in query.stream()]
+        results = self._with_subcollection_assets(query.stream(**rpc_opts(FS_STREAM_TIMEOUT)), fields)
         
         # Client-side filter for has_deliverable (nested field)
         if has_deliverable is not None:
@@ -224,13 +720,30 @@ class FirestoreService:
         return results
     
     def delete_character(self, char_id: str) -> bool:
-        """Delete a character document."""
+        """
+        Delete a character document and its asset docs.
+        Deletes are idempotent, so there's no existence check; always returns True.
+        """
         doc_ref = self.db.collection(self.CHARACTERS_COLLECTION).document(char_id)
-        if doc_ref.get().exists:
-            doc_ref.delete()
-            print(f"   🗑️ Deleted character: {char_id}")
-            return True
-        return False
+        batch = self.db.batch()
+        for asset_ref in doc_ref.collection(self.ASSETS_SUBCOLLECTION).list_documents():
+            batch.delete(asset_ref)
+        batch.delete(doc_ref)
+        batch.commit(**rpc_opts())
+        self._invalidate(char_id)
+        print(f"   🗑️ Deleted character: {char_id}")
+        return True
+    
+    def bulk(self, ops_per_second: int = 500):
+        """
+        BulkWriter for multi-document writes (batched, parallel commits with
+        built-in retry/backoff). Call flush() at phase boundaries and close()
+        when done.
+        """
+        from google.cloud.firestore_v1.bulk_writer import BulkWriterOptions
+        return self.db.bulk_writer(
+            options=BulkWriterOptions(initial_ops_per_second=ops_per_second)
+        )
     
     # ========== Dance Job Operations ==========
     
@@ -255,11 +768,11 @@ class FirestoreService:
             "character_id": char_id,
             "motion_ref_video": motion_ref_video,
             "status": status,
-            "created_at": firestore.SERVER_TIMESTAMP,
-            "updated_at": firestore.SERVER_TIMESTAMP
+            "created_at": _firestore().SERVER_TIMESTAMP,
+            "updated_at": _firestore().SERVER_TIMESTAMP
         }
         
-        doc_ref = self.db.collection(self.DANCE_JOBS_COLLECTION).add(job_data)
+        doc_ref = self.db.collection(self.DANCE_JOBS_COLLECTION).add(job_data, **rpc_opts())
         job_id = doc_ref[1].id
         
         print(f"   📋 Created dance job: {job_id}")
@@ -267,8 +780,8 @@ class FirestoreService:
     
     def update_dance_job(self, job_id: str, updates: dict) -> None:
         """Update a dance job record."""
-        updates["updated_at"] = firestore.SERVER_TIMESTAMP
-        self.db.collection(self.DANCE_JOBS_COLLECTION).document(job_id).update(updates)
+        updates["updated_at"] = _firestore().SERVER_TIMESTAMP
+        self.db.collection(self.DANCE_JOBS_COLLECTION).document(job_id).update(updates, **rpc_opts())
     
     # ========== Instagram Post Operations ==========
     
@@ -299,22 +812,31 @@ class FirestoreService:
             "media_url": media_url,
             "status": status,
             "post_id": post_id,
-            "published_at": firestore.SERVER_TIMESTAMP if status == "published" else None,
+            "published_at": _firestore().SERVER_TIMESTAMP if status == "published" else None,
             "insights": {"likes": 0, "comments": 0, "views": 0},
-            "created_at": firestore.SERVER_TIMESTAMP
+            "created_at": _firestore().SERVER_TIMESTAMP
         }
         
-        doc_ref = self.db.collection(self.INSTAGRAM_POSTS_COLLECTION).add(post_data)
+        doc_ref = self.db.collection(self.INSTAGRAM_POSTS_COLLECTION).add(post_data, **rpc_opts())
         return doc_ref[1].id
     
     def update_instagram_post(self, doc_id: str, updates: dict) -> None:
         """Update an Instagram post record."""
-        self.db.collection(self.INSTAGRAM_POSTS_COLLECTION).document(doc_id).update(updates)
+        self.db.collection(self.INSTAGRAM_POSTS_COLLECTION).document(doc_id).update(updates, **rpc_opts())
+    
+    def get_instagram_post(self, doc_id: str) -> Optional[dict]:
+        """Get an Instagram post record by document ID."""
+        doc = self.db.collection(self.INSTAGRAM_POSTS_COLLECTION).document(doc_id).get(**rpc_opts())
+        if doc.exists:
+            return doc.to_dict() | {"doc_id": doc.id}
+        return None
     
-    def get_posts_by_status(self, status: str) -> List[dict]:
-        """Get all Instagram posts with a given status."""
+    def get_posts_by_status(self, status: str, fields: Optional[List[str]] = None) -> List[dict]:
+        """Get all Instagram posts with a given status (optionally only `fields`)."""
         query = self.db.collection(self.INSTAGRAM_POSTS_COLLECTION).where("status", "==", status)
-        return [doc.to_dict() | {"doc_id": doc.id} for doc in query.stream()]
+        if fields:
+            query = query.select(fields)
+        return [doc.to_dict() | {"doc_id": doc.id} for doc in query.stream(**rpc_opts(FS_STREAM_TIMEOUT))]
     
     # ========== Utility ==========
     
@@ -342,8 +864,13 @@ class FirestoreService:
     
     def get_character_count(self) -> int:
         """Get total number of characters."""
-        # Use aggregation query if available, otherwise count docs
-        docs = self.db.collection(self.CHARACTERS_COLLECTION).stream()
+        collection = self.db.collection(self.CHARACTERS_COLLECTION)
+        
+        # Server-side COUNT aggregation (one RPC); older SDKs lack count()
+        if hasattr(collection, "count"):
+            return collection.count().get(**rpc_opts())[0][0].value
+        
+        docs = collection.stream(**rpc_opts(FS_STREAM_TIMEOUT))
         return sum(1 for _ in docs)
 
 
@@ -13,8 +13,8 @@ from typing import Optional, Dict, Any
 ROOT = Path(__file__).parent.parent
 sys.path.insert(0, str(ROOT))
 
-from services.gcs_service import GCSService
-from services.firestore_service import FirestoreService
+from services.gcs_service import get_gcs_service
+from services.firestore_service import get_firestore_service
 
 
 class CloudSyncManager:
@@ -23,8 +23,8 @@ class CloudSyncManager:
     """
     
     def __init__(self):
-        self.gcs = GCSService()
-        self.fs = FirestoreService()
+        self.gcs = get_gcs_service()
+        self.fs = get_firestore_service()
         self._upload_cache = {}  # Prevent duplicate uploads
     
     def upload_and_sync(
@@ -1,6 +1,8 @@
 import os
 import json
 import shutil
+import threading
+from functools import wraps
 from datetime import datetime
 
 # Root Constants
@@ -9,6 +11,17 @@ CHAR_DIR = os.path.join(ROOT, "output", "characters")
 DB_FILE = os.path.join(CHAR_DIR, "character_db.json")
 MUSIC_DB_FILE = os.path.join(ROOT, "utils", "music_styles_db.json")
 
+# Serializes load -> modify -> save cycles between threads in this process
+# (e.g. dance versions generated in parallel for the same character)
+_DB_LOCK = threading.RLock()
+
+def _locked(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with _DB_LOCK:
+            return func(*args, **kwargs)
+    return wrapper
+
 def load_db():
     """Load the character database."""
     if not os.path.exists(DB_FILE):
@@ -20,6 +33,27 @@ def load_db():
         print(f"⚠️ Error loading DB: {e}")
         return []
 
+def iter_db():
+    """
+    Iterate over character entries without building the full list.
+    Streams with ijson when available, otherwise falls back to load_db().
+    A parse error mid-stream is raised rather than ending the iteration
+    early, so callers never mistake a partial read for the whole DB.
+    """
+    try:
+        import ijson
+    except ImportError:
+        yield from load_db()
+        return
+
+    try:
+        f = open(DB_FILE, "rb")
+    except FileNotFoundError:
+        return
+    with f:
+        yield from ijson.items(f, "item")
+
+@_locked
 def save_db(db):
     """Save the character database safely."""
     if not os.path.exists(CHAR_DIR):
@@ -29,9 +63,12 @@ def save_db(db):
     if os.path.exists(DB_FILE):
         shutil.copy2(DB_FILE, DB_FILE + ".bak")
         
+    # Write to a temp file and swap it in, so concurrent readers never see a partial file
+    tmp_file = f"{DB_FILE}.{os.getpid()}.{threading.get_ident()}.tmp"
     try:
-        with open(DB_FILE, "w", encoding="utf-8") as f:
+        with open(tmp_file, "w", encoding="utf-8") as f:
             json.dump(db, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_file, DB_FILE)
     except Exception as e:
         print(f"❌ Error saving DB: {e}")
 
@@ -62,6 +99,7 @@ def get_music_style(style_id):
             return entry
     return None
 
+@_locked
 def update_entry(char_id, updates):
     """
     Update a specific entry in the DB.
@@ -90,6 +128,7 @@ def update_entry(char_id, updates):
         return True
     return False
 
+@_locked
 def upsert_asset(char_id, asset_data):
     """
     Upserts an asset entry into the 'assets' list.
@@ -140,6 +179,7 @@ def upsert_asset(char_id, asset_data):
     save_db(db)
     return True
 
+@_locked
 def register_character(char_id, name, anime, metadata=None, assets=None, prompts=None):
     """Create or update a full character registry."""
     db = load_db()
@@ -0,0 +1,25 @@
+"""
+Asset path helpers shared by the migration/audit scripts.
+"""
+import os
+
+# Path classes returned by classify_path()
+PATH_GCS, PATH_LOCAL_WIN, PATH_OTHER = 0, 1, 2
+
+
+def classify_path(v):
+    """PATH_GCS for gs:// URIs, PATH_LOCAL_WIN for C: paths, else PATH_OTHER"""
+    return PATH_GCS if v[:5] == "gs://" else PATH_LOCAL_WIN if v[:2] == "C:" else PATH_OTHER
+
+
+def scan_suffix(path, suffixes, recursive=False):
+    """
+    Files in path whose (lowercased) extension, without the dot, is in
+    suffixes, as os.DirEntry. With recursive, subdirectories are walked too.
+    """
+    with os.scandir(path) as it:
+        for e in it:
+            if recursive and e.is_dir(follow_symlinks=False):
+                yield from scan_suffix(e.path, suffixes, recursive)
+            elif e.is_file(follow_symlinks=False) and e.name.rpartition('.')[2].lower() in suffixes:
+                yield e
@@ -357,58 +357,64 @@ from services.gemini_service import GeminiService
 from core.cosplay import create_cosplay_version
 # ... existing ...
 
-def run_primary_dance_generation(char_img, ref_video, char_id=None, reuse_cosplay=False):
+def ensure_cosplay_version(char_img, char_id=None, reuse_cosplay=False):
+    """
+    Create (or reuse) the cosplay version of an anime character image.
+    Returns the image to animate: the cosplay version, or char_img if it
+    already is one or generation failed.
+    """
+    # If the input is the Anime Image (assumed if not ending in _cosplay.png)
+    # Note: char_img is likely output/characters/NAME.png
+    basename = os.path.basename(char_img)
+    if "_cosplay" in basename:
+        return char_img
+    
+    cosplay_path = char_img.replace(".png", "_cosplay.png")
+    if reuse_cosplay and os.path.exists(cosplay_path):
+        print(f"   ✨ Reusing existing Cosplay Version: {os.path.basename(cosplay_path)}")
+        return cosplay_path
+    
+    print(f"   ✨ Generating/Updating Cosplay Version: {os.path.basename(cosplay_path)}")
+    try:
+        service = GeminiService()
+        # Fetch Metadata for better prompting
+        char_name = None
+        anime_name = None
+        if char_id:
+            from utils.db_utils import get_entry
+            entry = get_entry(char_id)
+            if entry:
+                char_name = entry.get("name", char_id)
+                anime_name = entry.get("anime")
+
+        # Force creation (since this is a REDO pipeline)
+        # Core cosplay function: create_cosplay_version(anime_path, output_path, service, char_name, anime_name)
+        success = create_cosplay_version(char_img, cosplay_path, service, character_name=char_name, anime_name=anime_name)
+        if success:
+            # Update DB if ID provided (Cosplay asset)
+            if char_id:
+                from utils.db_utils import upsert_asset
+                upsert_asset(char_id, {"title": "primary", "cosplay_image": cosplay_path})
+            return cosplay_path
+    except Exception as e:
+        print(f"   ⚠️ Cosplay generation failed: {e}. Using original image.")
+    return char_img
+
+def run_primary_dance_generation(char_img, ref_video, char_id=None, reuse_cosplay=False, prepare_cosplay=True):
     """
     Phase 1: Generates the primary dance video using Kling.
     Handles Cosplay Gen -> Alignment -> Submission.
+    With prepare_cosplay=False, char_img is animated as given (the caller
+    already ran ensure_cosplay_version).
     """
     print(f"\n🎬 STARTING PRIMARY DANCE GENERATION")
     print(f"   👤 Character: {os.path.basename(char_img)}")
     print(f"   🎥 Reference: {os.path.basename(ref_video)}")
     
     # 0. Ensure Cosplay Version Exists (or Regenerate)
-    # If the input is the Anime Image (assumed if not ending in _cosplay.png)
     input_for_alignment = char_img
-    
-    # Check if we should create a cosplay version
-    # Note: char_img is likely output/characters/NAME.png
-    basename = os.path.basename(char_img)
-    
-    if "_cosplay" not in basename:
-        service = GeminiService()
-        cosplay_path = char_img.replace(".png", "_cosplay.png")
-        
-        should_generate = True
-        if reuse_cosplay and os.path.exists(cosplay_path):
-            print(f"   ✨ Reusing existing Cosplay Version: {os.path.basename(cosplay_path)}")
-            should_generate = False
-            input_for_alignment = cosplay_path
-        
-        if should_generate:
-            print(f"   ✨ Generating/Updating Cosplay Version: {os.path.basename(cosplay_path)}")
-            
-            try:
-                 # Fetch Metadata for better prompting
-                 char_name = None
-                 anime_name = None
-                 if char_id:
-                     from utils.db_utils import get_entry
-                     entry = get_entry(char_id)
-                     if entry:
-                         char_name = entry.get("name", char_id)
-                         anime_name = entry.get("anime")
-
-                 # Force creation (since this is a REDO pipeline)
-                 # Core cosplay function: create_cosplay_version(anime_path, output_path, service, char_name, anime_name)
-                 success = create_cosplay_version(char_img, cosplay_path, service, character_name=char_name, anime_name=anime_name)
-                 if success:
-                     input_for_alignment = cosplay_path
-                     # Update DB if ID provided (Cosplay asset)
-                     if char_id:
-                         from utils.db_utils import upsert_asset
-                         upsert_asset(char_id, {"title": "primary", "cosplay_image": cosplay_path})
-            except Exception as e:
-                print(f"   ⚠️ Cosplay generation failed: {e}. Using original image.")
+    if prepare_cosplay:
+        input_for_alignment = ensure_cosplay_version(char_img, char_id, reuse_cosplay=reuse_cosplay)
 
     # 1. Alignment
     aligned_img, alignment_prompt = align_character_to_video(input_for_alignment, ref_video)
@@ -457,12 +463,14 @@ def run_primary_dance_generation(char_img, ref_video, char_id=None, reuse_cospla
         print("❌ Primary Dance Generation Failed.")
         return None, None
 
-def run_end_to_end_pipeline(char_img, ref_video, char_id=None, reuse_cosplay=False, style_id=None):
+def run_end_to_end_pipeline(char_img, ref_video, char_id=None, reuse_cosplay=False, style_id=None, prepare_cosplay=True):
     """
     Orchestrates the full flow: Primary Dance -> Remix -> Deliverable.
     """
     # Phase 1
-    dance_path, _ = run_primary_dance_generation(char_img, ref_video, char_id, reuse_cosplay=reuse_cosplay)
+    dance_path, _ = run_primary_dance_generation(
+        char_img, ref_video, char_id, reuse_cosplay=reuse_cosplay, prepare_cosplay=prepare_cosplay
+    )
     
     if not dance_path:
         return None